@@ -0,0 +1,100 @@
+"""
+Measure tbx.contents() against a plain read + re.split()
+
+This is free and unencumbered software released into the public domain.
+For more information, please refer to <http://unlicense.org/>
+
+Usage: PYTHONPATH=. python bench/contents_split.py [size ...]
+
+Sizes are byte counts with an optional K or M suffix (default: 1K 1M 100M).
+For each size, a file of short text lines is written to a temporary
+directory and read in five ways: whole string, list split on the default
+'\\n', list split on a literal separator, list split on a regex separator,
+and list split on a list of regexes. 'baseline' is what contents() did
+before literal separators were recognized and patterns were cached.
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+import tbx
+
+
+# -----------------------------------------------------------------------------
+def baseline(name, fmt='str', sep=None):
+    """
+    contents() as it was: read the whole file, then re.split() if asked
+    """
+    with open(name, 'r') as rbl:
+        data = rbl.read()
+    if fmt == 'list':
+        sep = sep or '\n'
+        rsep = sep if isinstance(sep, str) else "|".join(sep)
+        return re.split(rsep, data)
+    return data
+
+
+# -----------------------------------------------------------------------------
+def best_time(func, *args, **kwargs):
+    """
+    Return the best per-call time of func(*args, **kwargs) in seconds over a
+    few rounds, each long enough to swamp timer resolution
+    """
+    func(*args, **kwargs)
+    best = None
+    for _ in range(3):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func(*args, **kwargs)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if 0.2 <= elapsed:
+                break
+        per = elapsed / calls
+        best = per if best is None else min(best, per)
+    return best
+
+
+# -----------------------------------------------------------------------------
+def parse_size(text):
+    """
+    Turn '1K', '1M', or '512' into a number of bytes
+    """
+    scale = {'K': 1024, 'M': 1024 * 1024}
+    if text[-1].upper() in scale:
+        return int(text[:-1]) * scale[text[-1].upper()]
+    return int(text)
+
+
+# -----------------------------------------------------------------------------
+def main(args):
+    """
+    Write the test files and report per-call times for each case
+    """
+    sizes = args or ['1K', '1M', '100M']
+    cases = [("str", {}),
+             ("list, default sep", {'fmt': 'list'}),
+             ("list, literal sep", {'fmt': 'list', 'sep': ', '}),
+             ("list, regex sep", {'fmt': 'list', 'sep': r'\s+'}),
+             ("list, list sep", {'fmt': 'list', 'sep': ['the', 'is']})]
+    line = "this is the line, with some words, and commas\n"
+    print("{:>6s} {:20s} {:>12s} {:>12s} {:>8s}".format(
+        "size", "case", "baseline", "tbx", "speedup"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            name = os.path.join(tmpdir, size)
+            nbytes = parse_size(size)
+            with open(name, 'w') as wbl:
+                wbl.write((line * (nbytes // len(line) + 1))[:nbytes])
+            for label, kwargs in cases:
+                old = best_time(baseline, name, **kwargs)
+                new = best_time(tbx.contents, name, **kwargs)
+                print("{:>6s} {:20s} {:10.3f}ms {:10.3f}ms {:7.2f}x".format(
+                    size, label, old * 1000, new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
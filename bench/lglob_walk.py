@@ -0,0 +1,101 @@
+"""
+Measure tbx.lglob() against the glob.glob()-per-pattern way on a big tree
+
+This is free and unencumbered software released into the public domain.
+For more information, please refer to <http://unlicense.org/>
+
+Usage: PYTHONPATH=. python bench/lglob_walk.py [files [workers]]
+
+A synthetic tree of about *files* files (default 1000000) is built in a
+temporary directory, laid out like many mounts holding logs:
+data/m<N>/logs/<day>/<file>.{gz,txt}. Each case globs it for the .gz files
+in three ways: 'baseline' is what lglob() did before it was built on
+iglob_many() (glob.glob() for each pattern, then list(set()), though
+with recursive=True so '**' means the same to both), then
+lglob() walking serially, then lglob(workers=...) listing directories on a
+thread pool. The times are for a warm page cache; the thread pool gains
+most when listing has to wait on the disk or the network.
+"""
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import tbx
+
+
+# -----------------------------------------------------------------------------
+def baseline(*args):
+    """
+    lglob() as it was, but recursive
+    """
+    rval = []
+    [rval.extend(y) for y in [glob.glob(x, recursive=True) for x in args]]
+    return list(set(rval))
+
+
+# -----------------------------------------------------------------------------
+def best_time(func, *args, **kwargs):
+    """
+    Return the best time of three calls to func(*args, **kwargs) in seconds
+    and the length of what it returned
+    """
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        count = len(func(*args, **kwargs))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, count)
+
+
+# -----------------------------------------------------------------------------
+def build(root, files, mounts=100, days=10):
+    """
+    Create about *files* empty files under *root*, spread over *mounts*
+    mount directories with *days* directories each
+    """
+    per_dir = max(1, files // (mounts * days))
+    for mount in range(mounts):
+        for day in range(days):
+            dirpath = os.path.join(root, "data", "m{}".format(mount), "logs",
+                                   "day{}".format(day))
+            os.makedirs(dirpath)
+            for idx in range(per_dir):
+                name = "f{}.{}".format(idx, "gz" if idx % 2 else "txt")
+                os.close(os.open(os.path.join(dirpath, name),
+                                 os.O_CREAT | os.O_WRONLY, 0o644))
+    return mounts
+
+
+# -----------------------------------------------------------------------------
+def main(args):
+    """
+    Build the tree and report the time for each case
+    """
+    files = int(args[0]) if args else 1000000
+    workers = int(args[1]) if 1 < len(args) else 8
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        mounts = build(root, files)
+        print("built {} files in {:.1f}s".format(files,
+                                                 time.perf_counter() - start))
+        cases = [("one pattern", [os.path.join(root, "data/*/logs/*/*.gz")]),
+                 ("'**' pattern", [os.path.join(root, "data/**/*.gz")]),
+                 ("pattern per mount",
+                  [os.path.join(root, "data/m{}/logs/*/*.gz".format(_))
+                   for _ in range(mounts)])]
+        print("{:20s} {:>10s} {:>10s} {:>10s}  {}".format(
+            "case", "baseline", "serial", "workers={}".format(workers),
+            "matches"))
+        for label, patterns in cases:
+            old = best_time(baseline, *patterns)
+            serial = best_time(tbx.lglob, *patterns)
+            parallel = best_time(tbx.lglob, *patterns, workers=workers)
+            print("{:20s} {:9.2f}s {:9.2f}s {:9.2f}s  {}".format(
+                label, old[0], serial[0], parallel[0], old[1]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
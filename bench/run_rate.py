@@ -0,0 +1,68 @@
+"""
+Measure how many short commands per second tbx.run() can start
+
+This is free and unencumbered software released into the public domain.
+For more information, please refer to <http://unlicense.org/>
+
+Usage: PYTHONPATH=. python bench/run_rate.py [count]
+
+'baseline' reproduces what run() used to do for each call: shlex.split() the
+command and start it with a default Popen, which searches $PATH for the
+executable. The tbx.run() cases look the executable up once through a
+cached $PATH lookup and pass Popen its absolute path, with a command string
+(split by shlex) and with a pre-split argv list (no shlex). On Python 3.10+
+Popen starts the child the same way (vfork) in every case. The tbx.Shell
+case runs each command through one long-lived shell.
+"""
+import shlex
+import subprocess as sproc
+import sys
+import time
+
+import tbx
+
+
+# -----------------------------------------------------------------------------
+def baseline(cmd):
+    """
+    Run *cmd* the way run() did before the spawn fast path
+    """
+    child = sproc.Popen(shlex.split(cmd), stdin=sproc.PIPE, stdout=sproc.PIPE,
+                        stderr=sproc.STDOUT)
+    return child.communicate()[0].decode()
+
+
+# -----------------------------------------------------------------------------
+def rate(func, arg, count, rounds=5):
+    """
+    Call func(arg) *count* times in each of *rounds* rounds and return the
+    best rate in calls per second, which is the least disturbed by noise
+    """
+    func(arg)
+    best = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(count):
+            func(arg)
+        best = max(best, count / (time.perf_counter() - start))
+    return best
+
+
+# -----------------------------------------------------------------------------
+def main(args):
+    """
+    Report commands per second for each way of running a trivial command
+    """
+    count = int(args[0]) if args else 500
+    with tbx.Shell() as shell:
+        cases = [("baseline Popen(shlex.split(str))", baseline, "true -x"),
+                 ("tbx.run(str)", tbx.run, "true -x"),
+                 ("tbx.run(list)", tbx.run, ["true", "-x"]),
+                 ("tbx.Shell().run(str)", shell.run, "true -x")]
+        for name, func, arg in cases:
+            print("{:36s} {:8.1f} commands/s".format(name, rate(func, arg,
+                                                                count)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
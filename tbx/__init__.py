@@ -4,27 +4,76 @@ Toolbox
 This is free and unencumbered software released into the public domain.
 For more information, please refer to <http://unlicense.org/>
 """
+import ast
+import codecs
+import collections
 import contextlib
+import ctypes
+import fnmatch
+import functools
 import glob
+import hashlib
 from importlib import import_module
 import inspect
+import json
+import locale
+import mmap
 import os
 import os.path as osp
 import pdb
 from py.path import local
 import random
 import re
+try:
+    import resource
+except ImportError:
+    resource = None
+import select
+import selectors
 import shlex
+import shutil
 try:
     import StringIO as io
 except ImportError:
     import io
     file = io.TextIOWrapper
 import subprocess as sproc
+import stat
 import sys
+import tempfile
+import threading
+import time
+import uuid
 from tbx import verinfo
 
 
+# Since Python 3.10, Popen starts children with vfork() unless told
+# otherwise. Before that, it only avoids fork() by using posix_spawn(), which
+# needs close_fds=False. That is safe because Python creates its file
+# descriptors non-inheritable, so only the ones handed to Popen reach the
+# child. On 3.10+ posix_spawn() is slower than vfork() (Popen converts the
+# whole environment for it on every call), so we leave the default alone.
+_SPAWN_KW = {} if (3, 10) <= sys.version_info else {'close_fds': False}
+
+# The inotify(7) events follow() wakes up for: IN_MODIFY, IN_MOVED_FROM,
+# IN_MOVED_TO, IN_CREATE, and IN_DELETE
+_IN_EVENTS = 0x002 | 0x040 | 0x080 | 0x100 | 0x200
+
+# The format of collect_missing_docs() cache records. Records written in
+# another format are ignored (and rewritten).
+_DOC_CACHE_VERSION = 2
+
+# What collect_missing_docs() skips by default, as walk() patterns
+_DOC_EXCLUDE = ('venv*/', '.*/', '__pycache__/', '*egg-info*/', 'setup.py')
+
+# The ast nodes that open a new scope, which _ast_stmts() doesn't descend
+# into, and the decorators that make a method something other than a
+# function on its class
+_AST_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+_AST_NONFUNCS = ('classmethod', 'property', 'cached_property', 'getter',
+                 'setter', 'deleter')
+
+
 # -----------------------------------------------------------------------------
 def abspath(relpath):
     """
@@ -36,6 +85,96 @@ def abspath(relpath):
     return osp.abspath(relpath)
 
 
+# -----------------------------------------------------------------------------
+async def arun(cmd, input=None, output=None, timeout=None):
+    """
+    Coroutine counterpart of run(). Run *cmd* in a separate process without
+    blocking the event loop and return stdout + stderr. *input* and *output*
+    accept the same forms as they do for run(), with 'cmd |' and '| cmd'
+    connected by OS pipes.
+
+    If the command (including any pipeline stages) has not finished within
+    *timeout* seconds, the children are killed and asyncio.TimeoutError is
+    raised. If the awaiting task is cancelled, the children are killed as
+    well.
+    """
+    # asyncio takes longer to import than the rest of tbx put together, so
+    # only code that awaits arun() pays for it
+    import asyncio
+    (cmds, input, output) = _stages([cmd], input, output)
+    opened = []
+    pipes = set()
+    children = []
+    try:
+        stdout = _run_output(output, opened)
+        (stdin, data) = _run_input(input, opened)
+        for idx, cmd in enumerate(cmds):
+            if idx < len(cmds) - 1:
+                (rfd, wfd) = os.pipe()
+                pipes.update((rfd, wfd))
+            else:
+                (rfd, wfd) = (None, stdout)
+            (argv, executable) = _argv(cmd)
+            child = await asyncio.create_subprocess_exec(
+                *argv, executable=executable, **_SPAWN_KW,
+                stdin=stdin, stdout=wfd, stderr=sproc.STDOUT)
+            children.append(child)
+            for fd in (stdin, wfd):
+                if fd in pipes:
+                    os.close(fd)
+                    pipes.discard(fd)
+            stdin = rfd
+        out = await asyncio.wait_for(_acommunicate(children, data), timeout)
+    except BaseException:
+        for child in children:
+            if child.returncode is None:
+                with contextlib.suppress(ProcessLookupError):
+                    child.kill()
+                await child.wait()
+        raise
+    finally:
+        for fobj in opened:
+            fobj.close()
+        for fd in pipes:
+            os.close(fd)
+    return _run_result(output, out)
+
+
+# -----------------------------------------------------------------------------
+async def _acommunicate(children, data):
+    """
+    Feed *data* to the first of *children*, collect the output of the last
+    one, and wait for all of them to exit. Returns the collected bytes, or
+    None if the last child's stdout is not a pipe.
+    """
+    import asyncio
+    if len(children) == 1:
+        (out, _) = await children[0].communicate(data)
+        return out
+    ((out, _), _) = await asyncio.gather(children[-1].communicate(),
+                                         _afeed(children[0], data))
+    for child in children[:-1]:
+        await child.wait()
+    return out
+
+
+# -----------------------------------------------------------------------------
+async def _afeed(child, data):
+    """
+    Write *data* (if any) to *child*'s stdin pipe and close it
+    """
+    if child.stdin is None:
+        return
+    try:
+        if data:
+            child.stdin.write(data)
+            await child.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        child.stdin.close()
+
+
 # -----------------------------------------------------------------------------
 def basename(path, segments=None):
     """
@@ -118,47 +257,440 @@ def conditional_debug(**kw):
 
 
 # -----------------------------------------------------------------------------
-def contents(name=None, default=None, fmt='str', sep=None):
+def contents(name=None, default=None, fmt='str', sep=None, lazy=False,
+             cache=None, encoding=None, errors=None, into=None, head=None,
+             tail=None, offset=None, length=None):
     """
     Return the contents of file named *name*. If the file does not exist,
     return the value in *default*. If the file is not accessible for some other
     reason, raise an exception.
 
     The *fmt* argument determines the format of the return value. It can be
-    'str', str, 'list', or list. If it is 'str' or str, the contents of the
-    file is returned as a string.
+    'str', str, 'list', list, 'bytes', bytes, or 'mmap'. If it is 'str' or
+    str, the contents of the file is returned as a string.
 
     If it is 'list' or list, the contents of the file will be split on the
     value of *sep* and the resulting list will be returned.
 
+    For 'str' and 'list', the file is decoded according to *encoding* and
+    *errors*, which mean what they do for open(). By default, the locale's
+    encoding is used.
+
+    If it is 'bytes' or bytes, the contents of the file is returned
+    undecoded, which is faster when the text isn't needed. If *into* is a
+    writable buffer (a bytearray or memoryview, say), the file is read
+    straight into it instead, with no new allocation, and the number of bytes
+    read is returned. At most len(*into*) bytes are read.
+
+    If it is 'mmap', a read-only mmap.mmap of the file is returned. It
+    behaves like a bytes object (slicing, find(), bytes regexes) without
+    reading the file into memory. The caller should close() it when done.
+    An empty file, which cannot be mapped, gives b''.
+
     The *sep* argument can be a regex in a string or a list of regexes. If
     *fmt* is 'list' or list and *sep* is not specified, the file content will
-    be split on '\\n'.
+    be split on '\\n'. A separator without regex metacharacters (like the
+    default) is split on with str.split(), which is much faster than
+    re.split().
+
+    If *lazy* is True (list format only), an iterator is returned instead of
+    a list. It reads the file in chunks and yields the same records the list
+    would contain, so memory use is bounded by the longest record rather than
+    the size of the file. The file is closed when the iterator is exhausted
+    or discarded.
+
+    If *cache* is a ContentCache (str and list formats only), the result is
+    served from it when the file has not changed since it was cached. If it
+    is True, a cache shared by all such calls is used.
+
+    To read only part of a file (str, list, and bytes formats, without lazy
+    or cache), give one of *head*, *tail*, or *offset* and *length*. The
+    file is read in blocks from the start (*head*) or the end (*tail*) until
+    enough has been seen, so the cost depends on the size of the result
+    rather than the size of the file.
+
+    *head*=N and *tail*=N select the first or last N records, where a record
+    ends with *sep* ('\n' by default), the way head(1) and tail(1) count
+    lines: a separator at the end of the file ends the last record rather
+    than starting an empty one. The str and bytes formats give the text of
+    the records, separators included. *sep* is matched against the undecoded
+    file, so *encoding* should be ASCII compatible (like UTF-8 or Latin-1).
+    For the same reason, newlines in a part of a file are left as they are
+    ('\r\n' stays '\r\n') rather than translated as they are when the
+    whole file is read.
+
+    *offset* and *length* select a range of bytes, starting *offset* bytes
+    into the file (or -*offset* bytes from the end if it is negative) and
+    running for *length* bytes or to the end of the file. A negative
+    *offset* reaching back past the start of the file starts at the start.
+    With *into*, the range is read into the buffer. If the file doesn't
+    exist, the same part of a str (or, for bytes, a bytes) *default* is
+    returned; a default of any other type is returned as it is.
+    """
+    binary = fmt in ('bytes', bytes, 'mmap')
+    if lazy and fmt not in ('list', list):
+        raise Error('lazy is only valid for list format')
+    if binary and (encoding or errors):
+        raise Error('encoding is only valid for str and list formats')
+    if into is not None and fmt not in ('bytes', bytes):
+        raise Error('into is only valid for bytes format')
+    if (head, tail, offset, length) != (None, None, None, None):
+        if lazy or cache or fmt == 'mmap':
+            raise Error('head, tail, offset, and length are only valid for'
+                        ' str, list, and bytes formats without lazy or cache')
+        return _contents_part(name, default, fmt, sep, encoding, errors,
+                              into, head, tail, offset, length)
+    if cache is True:
+        cache = _CONTENT_CACHE
+    if isinstance(cache, ContentCache):
+        if lazy or binary:
+            raise Error('cache is only valid for str and list formats')
+        return cache.contents(name, default=default, fmt=fmt, sep=sep,
+                              encoding=encoding, errors=errors)
+    if binary:
+        rbl = _open(name, 'rb', default,
+                    buffering=-1 if into is None else 0)
+    else:
+        rbl = _open(name, 'r', default, encoding=encoding, errors=errors)
+
+    if fmt == 'list' or fmt == list:
+        (regex, split) = _separator(_sepkey(sep))
+        if rbl is None:
+            rval = split(default)
+            return iter(rval) if lazy else rval
+        elif lazy:
+            return _records(rbl, regex)
+        with rbl:
+            return split(rbl.read())
+    elif fmt in ('str', str, 'bytes', bytes):
+        if sep:
+            if rbl is not None:
+                rbl.close()
+            raise Error('Non-default separator is only valid for list format')
+        if rbl is None:
+            return default
+        with rbl:
+            return rbl.read() if into is None else _readinto(rbl, into)
+    elif fmt == 'mmap':
+        if rbl is None:
+            return default
+        with rbl:
+            if os.fstat(rbl.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(rbl.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        if rbl is not None:
+            rbl.close()
+        raise Error('Invalid format')
+
+
+# -----------------------------------------------------------------------------
+def contents_many(paths, default=None, fmt='str', sep=None, workers=None,
+                  as_dict=False, encoding=None, errors=None):
+    """
+    Read each file in *paths* the way contents() would, with *default*,
+    *fmt*, *sep*, *encoding*, and *errors* applied to every file. The files
+    are read concurrently by up to *workers* threads, which hides the latency
+    of slow (e.g., network) filesystems.
+
+    Returns a list of results in the order of *paths*, or, if *as_dict* is
+    True, a dict mapping each path to its result. A file that can't be read
+    doesn't abort the batch: the exception contents() raised for it takes
+    the place of its result.
+    """
+    from concurrent import futures
+    if fmt not in ('str', str, 'list', list, 'bytes', bytes, 'mmap'):
+        raise Error('Invalid format')
+    if sep and fmt not in ('list', list):
+        raise Error('Non-default separator is only valid for list format')
+    if (encoding or errors) and fmt not in ('str', str, 'list', list):
+        raise Error('encoding is only valid for str and list formats')
+    paths = list(paths)
+    reader = functools.partial(_contents_one, default=default, fmt=fmt,
+                               sep=sep, encoding=encoding, errors=errors)
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(reader, paths))
+    return dict(zip(paths, results)) if as_dict else results
+
+
+# -----------------------------------------------------------------------------
+def _contents_one(name, **kwa):
+    """
+    Read a single file for contents_many(), returning any exception instead
+    of raising it
+    """
+    try:
+        return contents(name, **kwa)
+    except Exception as err:
+        return err
+
+
+# -----------------------------------------------------------------------------
+def _contents_part(name, default, fmt, sep, encoding, errors, into, head,
+                   tail, offset, length):
+    """
+    Read the part of file *name* selected by *head*, *tail*, or *offset* and
+    *length* for contents(). The other arguments are as for contents(). If
+    the file doesn't exist, the part is taken from *default* instead, if it
+    is text (or bytes, for the bytes format); any other default is returned
+    as it is.
+    """
+    aslist = fmt in ('list', list)
+    if fmt not in ('str', str, 'list', list, 'bytes', bytes):
+        raise Error('Invalid format')
+    if sep and not aslist:
+        raise Error('Non-default separator is only valid for list format')
+    counted = (head is not None) + (tail is not None)
+    if 1 < counted + (offset is not None or length is not None):
+        raise Error('head, tail, and offset/length are mutually exclusive')
+    if counted and into is not None:
+        raise Error('into is not valid with head or tail')
+
+    binary = fmt in ('bytes', bytes)
+    codec = encoding or locale.getpreferredencoding(False)
+    rbl = _open(name, 'rb', default)
+    if rbl is None:
+        if into is None and isinstance(default, bytes if binary else str):
+            rbl = io.BytesIO(default if binary
+                             else default.encode(codec, errors or 'strict'))
+        else:
+            return _separator(_sepkey(sep))[1](default) if aslist \
+                else default
+    with rbl:
+        if counted:
+            regex = _byte_separator(_sepkey(sep), codec)
+            if head is not None:
+                data = _head(rbl, regex, head)
+            else:
+                data = _tail(rbl, regex, tail)
+        else:
+            if offset is not None and offset < 0:
+                size = rbl.seek(0, os.SEEK_END)
+                rbl.seek(max(0, size + offset))
+            elif offset is not None:
+                rbl.seek(offset)
+            if into is not None:
+                view = memoryview(into).cast('B')
+                return _readinto(rbl, view if length is None
+                                 else view[:length])
+            data = rbl.read(-1 if length is None else length)
+
+    if binary:
+        return data
+    text = io.TextIOWrapper(io.BytesIO(data), encoding=encoding,
+                            errors=errors, newline='').read()
+    if not aslist:
+        return text
+    rval = _separator(_sepkey(sep))[1](text)
+    if counted and rval and rval[-1] == '':
+        rval.pop()
+    return rval
+
+
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=32)
+def _byte_separator(sep, encoding):
+    """
+    Compile separator key *sep* (see _sepkey()) into a bytes regex for
+    matching in a file encoded with *encoding*
+    """
+    rsep = sep if isinstance(sep, str) else "|".join(sep)
+    return re.compile(rsep.encode(encoding))
+
+
+# -----------------------------------------------------------------------------
+def _head(rbl, regex, count, block=65536, slack=1024):
+    """
+    Read binary file *rbl* forward from its current position until *count*
+    records ending in *regex* have been seen and return their bytes. As in
+    _records(), a match within *slack* bytes of the end of the data read so
+    far isn't trusted until more data arrives.
+    """
+    buf = bytearray()
+    pos = 0
+    while 0 < count:
+        data = rbl.read(block)
+        buf += data
+        for match in regex.finditer(buf, pos):
+            if data and len(buf) - slack < match.end():
+                break
+            pos = match.end()
+            count -= 1
+            if count == 0:
+                break
+        if not data:
+            return bytes(buf) if count else bytes(buf[:pos])
+    return bytes(buf[:pos])
+
+
+# -----------------------------------------------------------------------------
+def _tail(rbl, regex, count, block=65536, slack=1024):
+    """
+    Read binary file *rbl* backward from its end until the last *count*
+    records ending in *regex* have been seen and return their bytes. A
+    separator at the very end of the file ends the last record. Matches
+    within *slack* bytes of the start of the data read so far might grow
+    once earlier data is read, so they aren't trusted until it is. The block
+    size doubles on each step so rescanning costs O(size of the result).
+    """
+    if count < 1:
+        return b''
+    pos = rbl.seek(0, os.SEEK_END)
+    buf = b''
+    while True:
+        step = min(block, pos)
+        pos -= step
+        rbl.seek(pos)
+        buf = rbl.read(step) + buf
+        early = 0 if pos == 0 else slack
+        starts = [match.end() for match in regex.finditer(buf)
+                  if early <= match.start() and match.end() < len(buf)]
+        if count <= len(starts):
+            return buf[starts[-count]:]
+        if pos == 0:
+            return buf
+        block *= 2
+
+
+# -----------------------------------------------------------------------------
+def _open(name, mode, default, **kwa):
+    """
+    Open file *name* for contents(), passing *kwa* along to open(). If it
+    does not exist and *default* is set, return None so the caller can use
+    the default. If it can't be read, raise Error.
     """
     try:
-        rbl = open(name, 'r')
-        data = rbl.read()
+        return open(name, mode, **kwa)
     except IOError as err:
         if 'Permission denied' in str(err):
             raise Error("Can't read file {0}".format(name))
         elif 'No such file' in str(err) and default:
-            data = default
+            return None
         else:
             raise
-    if fmt == 'list' or fmt == list:
-        sep = sep or '\n'
-        if isinstance(sep, str):
-            rsep = sep
-        elif isinstance(sep, list):
-            rsep = "|".join(sep)
-        rval = re.split(rsep, data)
-    elif fmt == 'str' or fmt == str:
-        if sep:
-            raise Error('Non-default separator is only valid for list format')
-        rval = data
-    else:
-        raise Error('Invalid format')
-    return rval
+
+
+# -----------------------------------------------------------------------------
+def _readinto(rbl, buf):
+    """
+    Fill writable buffer *buf* from the start of unbuffered binary file
+    *rbl*, stopping at end of file, and return the number of bytes read
+    """
+    view = memoryview(buf).cast('B')
+    total = 0
+    while total < len(view):
+        count = rbl.readinto(view[total:])
+        if not count:
+            break
+        total += count
+    return total
+
+
+# -----------------------------------------------------------------------------
+def _records(rbl, regex, chunk=65536, slack=1024):
+    """
+    Read open file *rbl* in chunks and yield the records that
+    regex.split(rbl.read()) would return, closing *rbl* at the end.
+
+    A separator match within *slack* characters of the end of the data read
+    so far might grow once the next chunk arrives (think '(\\r\\n)+'), so
+    it is left in the buffer until more data arrives or the file ends.
+    """
+    with rbl:
+        buf = ''
+        while True:
+            data = rbl.read(chunk)
+            buf += data
+            (records, buf) = _split_records(buf, regex,
+                                            slack if data else None)
+            yield from records
+            if not data:
+                yield buf
+                return
+
+
+# -----------------------------------------------------------------------------
+def _split_records(buf, regex, slack):
+    """
+    Split the records ending in *regex* off the front of *buf* and return
+    them (with any groups in the separators, as re.split() gives them) and
+    what is left. A separator match within *slack* characters of the end of
+    *buf* might grow once more data arrives, so it and everything after it
+    are left; with *slack* None, every match is trusted.
+    """
+    rval = []
+    pos = 0
+    for match in regex.finditer(buf):
+        if slack is not None and len(buf) - slack <= match.end():
+            break
+        rval.append(buf[pos:match.start()])
+        rval.extend(match.groups())
+        pos = match.end()
+    return (rval, buf[pos:])
+
+
+# -----------------------------------------------------------------------------
+def _sepkey(sep):
+    """
+    Normalize the *sep* argument of contents() into a hashable key for
+    _separator() and ContentCache: a list becomes a tuple and an empty
+    separator becomes the default, '\\n'.
+    """
+    return tuple(sep) if isinstance(sep, list) else sep or '\n'
+
+
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=128)
+def _separator(sep):
+    """
+    Compile *sep* (a regex string or a tuple of regexes to be alternated) for
+    contents(). Returns (regex, split) where split(text) gives the same list
+    as regex.split(text). If the pattern matches only one literal string,
+    split is a str.split() on it, which is several times faster. Results are
+    cached, so repeated calls with the same separator don't recompile.
+    """
+    rsep = sep if isinstance(sep, str) else "|".join(sep)
+    regex = re.compile(rsep)
+    literal = _literal(rsep)
+    if literal:
+        return (regex, lambda text: text.split(literal))
+    return (regex, regex.split)
+
+
+# -----------------------------------------------------------------------------
+def _literal(rsep):
+    """
+    If regex *rsep* matches exactly one literal string, return that string.
+    Otherwise return None. Backslash escapes of punctuation and of n, r, t,
+    f, and v are understood; anything else is left to the regex engine.
+    """
+    escapes = {'n': '\n', 'r': '\r', 't': '\t', 'f': '\f', 'v': '\v'}
+    chars = []
+    idx = 0
+    while idx < len(rsep):
+        char = rsep[idx]
+        if char == '\\':
+            idx += 1
+            if len(rsep) <= idx:
+                return None
+            char = rsep[idx]
+            if char in escapes:
+                char = escapes[char]
+            elif char.isalnum() or char == '_':
+                return None
+        elif char in '.^$*+?{}[]|()':
+            return None
+        chars.append(char)
+        idx += 1
+    return ''.join(chars)
+
+
+# -----------------------------------------------------------------------------
+def _stat_key(stat):
+    """
+    The parts of os.stat() result *stat* that tell whether a file changed
+    """
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
 
 
 # -----------------------------------------------------------------------------
@@ -253,6 +785,192 @@ def fatal(msg='Fatal error with no reason specified'):
     sys.exit(msg)
 
 
+# -----------------------------------------------------------------------------
+def follow(path, sep='\n', whole=False, timeout=None, interval=(0.05, 1.0),
+           notify=True, encoding=None, errors=None):
+    """
+    Return a generator of the records appended to file *path*, like tail -f.
+    Records are split on *sep* as they are by contents(..., fmt='list'), but
+    a record is only generated once the separator following it has been
+    written. The file is decoded according to *encoding* and *errors*.
+
+    Reading starts at the current end of the file, or at the beginning if
+    *whole* is True. If *path* doesn't exist yet, it is waited for and read
+    from the beginning once it shows up. When *path* is replaced (say, by
+    log rotation), the old file is read to its end and the new one is read
+    from the beginning. When the file shrinks (it was truncated), reading
+    restarts at its beginning.
+
+    Where inotify is available and *notify* is True, the generator sleeps
+    until the directory holding *path* changes (checking anyway every
+    interval[1] seconds). Otherwise it polls, starting interval[0] seconds
+    apart and doubling the wait up to interval[1] while nothing is written.
+    If *timeout* is set, the generator ends after that many seconds without
+    new data.
+    """
+    start = None
+    if not whole:
+        try:
+            stat = os.stat(path)
+            start = (stat.st_dev, stat.st_ino, stat.st_size)
+        except FileNotFoundError:
+            pass
+    key = _sepkey(sep)
+    slack = None if _literal(key if isinstance(key, str) else
+                             "|".join(key)) else 1024
+    return _follow(path, start, _separator(key)[0], timeout, interval,
+                   notify, encoding, errors, slack)
+
+
+# -----------------------------------------------------------------------------
+def _follow(path, start, regex, timeout, interval, notify, encoding, errors,
+            slack, chunk=65536):
+    """
+    The generator behind follow(). *start* is the (device, inode, size) of
+    *path* when follow() was called, or None to read from the beginning. The
+    file and the inotify watch are opened when the generator starts, so one
+    that is never started holds no descriptors.
+
+    The file is read as bytes, *chunk* bytes at a time so memory use stays
+    bounded however much there is to catch up on, and decoded
+    incrementally, so a character split across two writes (or two chunks)
+    is decoded once both halves are in. As in _records(), a separator match
+    within *slack* characters of the end of the buffer isn't trusted while
+    data is still arriving; once the file stops growing, only a match
+    touching the very end is held back, since it could still grow. When the
+    generator times out, held matches are trusted. *slack* is None for a
+    literal separator, which can't grow.
+    """
+    rbl = None
+    watch = None
+    buf = ''
+    decoder = _follow_decoder(encoding, errors)
+    delay = interval[0]
+    last = time.monotonic()
+    try:
+        watch = _inotify(osp.dirname(osp.abspath(path))) if notify else None
+        while True:
+            if rbl is None:
+                rbl = _follow_open(path, start)
+                start = None
+            data = b'' if rbl is None else rbl.read(chunk)
+            if data:
+                buf += decoder.decode(data)
+                (records, buf) = _split_records(buf, regex, slack)
+                yield from records
+                delay = interval[0]
+                last = time.monotonic()
+                continue
+            (records, buf) = _split_records(buf, regex,
+                                            None if slack is None else 0)
+            yield from records
+
+            if rbl is not None:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    stat = None
+                fstat = os.fstat(rbl.fileno())
+                if stat is not None and (stat.st_dev, stat.st_ino) != \
+                   (fstat.st_dev, fstat.st_ino):
+                    buf += decoder.decode(b'', final=True)
+                    (records, buf) = _split_records(buf, regex, None)
+                    yield from records
+                    if buf:
+                        yield buf
+                    buf = ''
+                    decoder.reset()
+                    rbl.close()
+                    rbl = None
+                    continue
+                if fstat.st_size < rbl.tell():
+                    buf = ''
+                    decoder.reset()
+                    rbl.seek(0)
+                    continue
+
+            wait = interval[1] if watch is not None else delay
+            if timeout is not None:
+                left = last + timeout - time.monotonic()
+                if left <= 0:
+                    yield from _split_records(buf, regex, None)[0]
+                    return
+                wait = min(wait, left)
+            if watch is not None:
+                _inotify_wait(watch, wait)
+            else:
+                time.sleep(wait)
+                delay = min(2 * delay, interval[1])
+    finally:
+        if rbl is not None:
+            rbl.close()
+        if watch is not None:
+            os.close(watch)
+
+
+# -----------------------------------------------------------------------------
+def _follow_decoder(encoding, errors):
+    """
+    Return an incremental decoder for follow() that decodes as open() would
+    in text mode with *encoding* and *errors*, newline translation included
+    """
+    codec = encoding or locale.getpreferredencoding(False)
+    decoder = codecs.getincrementaldecoder(codec)(errors or 'strict')
+    return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+
+# -----------------------------------------------------------------------------
+def _follow_open(path, start):
+    """
+    Open *path* for follow(), or return None if it doesn't exist. If it is
+    still the file described by *start* (see _follow()), reading starts
+    where that file ended, or at the beginning if it has since shrunk.
+    """
+    try:
+        rbl = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    if start is not None:
+        stat = os.fstat(rbl.fileno())
+        if (stat.st_dev, stat.st_ino) == start[:2] and \
+           start[2] <= stat.st_size:
+            rbl.seek(start[2])
+    return rbl
+
+
+# -----------------------------------------------------------------------------
+def _inotify(dirname):
+    """
+    Return a non-blocking inotify descriptor watching directory *dirname*
+    for follow(), or None if inotify isn't available here
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (AttributeError, OSError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(dirname), _IN_EVENTS) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+# -----------------------------------------------------------------------------
+def _inotify_wait(fd, timeout):
+    """
+    Wait up to *timeout* seconds for inotify descriptor *fd* to report an
+    event, then discard whatever events are queued
+    """
+    if select.select([fd], [], [], timeout)[0]:
+        try:
+            while os.read(fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+
 # -----------------------------------------------------------------------------
 def git_last_tag():
     """
@@ -281,10 +999,12 @@ def git_hash(ref=None):
 def git_current_branch():
     """
     If we're in a git repo, return the name of the currently active branch.
+    Otherwise (or if HEAD is detached), return ''.
     """
-    curb = run("git symbolic-ref --short HEAD")
-    curb = curb.strip()
-    return curb
+    result = run("git symbolic-ref --short HEAD", result=True)
+    if result.returncode != 0:
+        return ""
+    return result.stdout.strip()
 
 
 # -----------------------------------------------------------------------------
@@ -308,235 +1028,1411 @@ def git_status():
 
 
 # -----------------------------------------------------------------------------
-def isnum_str(inp):
+def iglob_many(*patterns, recursive=True, workers=None, cache=None,
+               filter=None, exclude=None):
     """
-    Return True if the string input *inp* contains only whitespace and digits
+    Generate the paths matching any of the glob *patterns*, like
+    glob.iglob() does for one. A path matching more than one pattern is
+    generated once for each. If *recursive* is True, a '**' component matches
+    any number of directories (but doesn't descend into symbolic links to
+    directories, so a link cycle can't trap it).
+
+    All the patterns are matched in a single walk with os.scandir(), so a
+    directory is only listed once however many patterns need it, and the
+    type information in its entries saves a stat() per path. Components
+    without wildcards are just looked up, so patterns can share a long
+    literal prefix without listing the directories along it.
+
+    If *workers* is more than 1, directories are listed by a pool of that
+    many threads, which pays off when listing waits on the disk or the
+    network (many roots on separate mounts, say). Paths are then generated
+    as their directories are listed, so their order varies from run to run.
+
+    If *cache* is a GlobCache, directory listings are taken from it when the
+    directory hasn't changed since it was listed. If it is True, a cache
+    shared by all such calls is used.
+
+    If *filter* is given, only the matching paths it accepts are generated
+    (it doesn't stop the walk from descending into directories). It can be
+    a function that takes an os.DirEntry (or an object with the same
+    methods) for the path and returns True to keep it, or a dict with any
+    of these keys:
+
+        'min_size', 'max_size': bounds on the size in bytes
+        'newer': keep paths modified after this time (seconds since the
+            epoch) or after this file was
+        'type': 'file', 'dir', or 'link' (or a list of them); symbolic
+            links are only 'link'
+        'test': a function of the os.DirEntry, as above
+
+    The filter is applied to the entries as they are listed, so a path's
+    type costs no stat() and its size and time cost at most one (or none,
+    on platforms where listing a directory gives them). Paths that vanish
+    before they can be stat'd are dropped.
+
+    *exclude* takes gitignore-style patterns, as for walk(). Each pattern's
+    root is the directory its leading components without wildcards name
+    ('/var/log' for '/var/log/**/*.gz', the current directory for '*.py'),
+    and exclusion patterns are matched against paths relative to it, just
+    as walk() from that root would match them. Matching paths are dropped,
+    and the walk doesn't go into matching directories.
     """
-    if not isinstance(inp, str):
-        return False
-    elif re.match(r"^\s*\d+\s*$", inp):
-        return True
+    keep = _glob_filter(filter)
+    rules = _walk_rules(_walk_patterns(exclude))
+    roots = collections.defaultdict(set)
+    tops = {}
+    for (idx, pattern) in enumerate(patterns):
+        if not pattern:
+            continue
+        parts = pattern.split(os.sep)
+        comps = [_ for _ in parts[:-1] if _] + parts[-1:]
+        if not recursive:
+            comps = ['*' if _ == '**' else _ for _ in comps]
+        root = os.sep if not parts[0] else ''
+        roots[root].add((idx, tuple(comps)))
+        lit = 0
+        while lit < len(comps) - 1 and not glob.has_magic(comps[lit]):
+            lit += 1
+        tops[idx] = len(osp.join(root, *comps[:lit], ''))
+    skip = None if rules is None else (rules, tops)
+    if cache is True:
+        cache = _GLOB_CACHE
+    tasks = [(root, roots[root], True, cache, keep, skip) for root in roots]
+    if workers is not None and 1 < workers:
+        yield from _glob_parallel(tasks, workers)
     else:
-        return False
+        yield from _glob_serial(tasks)
 
 
 # -----------------------------------------------------------------------------
-def lglob(*args, dupl_allowed=False):
+def _glob_serial(tasks):
     """
-    glob a list of paths and return the results in a single list
+    Generate the paths found by running *tasks* (arguments for _glob_step())
+    and the tasks they lead to, depth first
     """
-    rval = []
-    [rval.extend(y) for y in [glob.glob(x) for x in args]]
-    if not dupl_allowed:
-        rval = list(set(rval))
-    return rval
+    stack = list(reversed(tasks))
+    while stack:
+        (paths, children) = _glob_step(*stack.pop())
+        yield from paths
+        stack.extend(reversed(children))
 
 
 # -----------------------------------------------------------------------------
-def collect_missing_docs(treeroot, ignore_l=None):
+def _glob_parallel(tasks, workers):
     """
-    Find all python files in a directory tree and report any functions/methods
-    that have no doc string or an undefined one.
+    Generate the paths found by running *tasks* (arguments for _glob_step())
+    and the tasks they lead to on a pool of *workers* threads, in the order
+    the tasks finish. If the generator is closed early, tasks not yet
+    started are cancelled.
     """
-    ignore_l = ignore_l or []
-    importables = []
-    prefix = treeroot + "/"
-    for dp, dl, fl in os.walk(treeroot):
-        del_these = []
-        for dname in dl:
-            if any([dname.startswith('venv'),
-                    dname.startswith('.'),
-                    dname == '__pycache__',
-                    'egg-info' in dname]):
-                del_these.append(dname)
-        for item in del_these:
-            dl.remove(item)
-        for fname in fl:
-            if fname.endswith(".py"):
-                iname = fname.replace(".py", "")
-                if iname == "__init__":
-                    importables.append(dp.replace(prefix, ""))
-                elif iname == "setup":
-                    continue
-                elif dp == '.':
-                    importables.append(iname)
-                else:
-                    importables.append("{}.{}".format(dp.replace(prefix, ""),
-                                                      iname))
+    from concurrent import futures
+    pool = futures.ThreadPoolExecutor(max_workers=workers)
+    pending = {pool.submit(_glob_step, *task) for task in tasks}
+    try:
+        while pending:
+            (done, pending) = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                (paths, children) = future.result()
+                pending.update(pool.submit(_glob_step, *task)
+                               for task in children)
+                yield from paths
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown()
 
-    missing_doc = []
-    for mname in importables:
-        try:
-            # print("import_module({})".format(mname))
-            mod = import_module(mname)
 
-            for name, obj in inspect.getmembers(mod, inspect.isclass):
-                if name in ignore_l:
-                    continue
-                if doc_missing(obj) and name not in missing_doc:
-                    missing_doc.append(name)
+# -----------------------------------------------------------------------------
+def _glob_step(dirpath, states, top, cache, keep, skip):
+    """
+    Match *states*, a set of (pattern index, components still to be matched)
+    tuples, in directory *dirpath*, listing it at most once (through GlobCache
+    *cache*, if it isn't None). Matching paths are kept if predicate *keep*
+    (see _glob_filter()) is None or accepts them. *skip* is None or (rules,
+    tops): paths that walk() rules *rules* (see _walk_rules()) match, taken
+    relative to the root of their pattern (the first tops[pattern index]
+    characters), are left out altogether. Returns them, each once per
+    pattern even if several of its states match it, and the tasks
+    (arguments for _glob_step()) for the subdirectories the walk goes on
+    into. A trailing '' component (the pattern ended with a separator)
+    matches only directories. *top* is True for the directory the walk
+    starts in.
+    """
+    states = _glob_expand(states)
+    prefix = osp.join(dirpath, '')
+    paths = collections.OrderedDict()
+    for (idx, comps) in states:
+        if dirpath and (comps == ('',) or (top and comps == ())) and \
+           _glob_keep(keep, dirpath, None, cache):
+            paths[(idx, prefix)] = prefix
+    children = collections.OrderedDict()
+    entries = None
+    for (idx, comps) in states:
+        if not comps or comps == ('',):
+            continue
+        comp = comps[0]
+        star = comp == '**'
+        rest = comps if star else comps[1:]
+        (done, slash, deeper) = _glob_after(rest, star)
+        if not glob.has_magic(comp):
+            path = prefix + comp
+            if not osp.lexists(path):
+                continue
+            if skip is not None and _glob_skip(skip, idx, path, None):
+                continue
+            if done and _glob_keep(keep, path, None, cache):
+                paths[(idx, path)] = path
+            if (slash or deeper) and osp.isdir(path):
+                if slash and _glob_keep(keep, path, None, cache):
+                    paths[(idx, path + os.sep)] = path + os.sep
+                if deeper:
+                    children.setdefault(comp, set()).add((idx, rest))
+            continue
+
+        if entries is None:
+            entries = _glob_list(dirpath) if cache is None \
+                else cache.listing(dirpath)
+        match = _glob_matcher(comp)
+        for entry in entries:
+            name = entry.name
+            if not match(name):
+                continue
+            path = prefix + name
+            if skip is not None and _glob_skip(skip, idx, path, entry):
+                continue
+            if done and _glob_keep(keep, path, entry, cache):
+                paths[(idx, path)] = path
+            if (slash or deeper) and entry.is_dir(follow_symlinks=not star):
+                if slash and _glob_keep(keep, path, entry, cache):
+                    paths[(idx, path + os.sep)] = path + os.sep
+                if deeper:
+                    children.setdefault(name, set()).add((idx, rest))
+    tasks = [(prefix + name, nxt, False, cache, keep, skip)
+             for (name, nxt) in children.items()]
+    return (list(paths.values()), tasks)
 
-                for mthname, mthobj in inspect.getmembers(obj,
-                                                          inspect.isfunction):
-                    if doc_missing(mthobj) and mthname not in missing_doc:
-                        missing_doc.append("{}.{}".format(name, mthname))
 
-            for name, obj in inspect.getmembers(mod, inspect.isfunction):
-                if doc_missing(obj) and name not in missing_doc:
-                    missing_doc.append("{}.{}".format(mname, name))
+# -----------------------------------------------------------------------------
+def _glob_skip(skip, idx, path, entry):
+    """
+    Return True if *path*, found by pattern *idx* (with os.DirEntry *entry*,
+    or None if it wasn't found by listing), is excluded by *skip* (see
+    _glob_step()). Paths in a pattern's root are never excluded.
+    """
+    (rules, tops) = skip
+    rel = path[tops[idx]:]
+    if not rel:
+        return False
+    return rules(rel, osp.isdir(path) if entry is None else entry.is_dir())
 
-        except SystemExit:
-            print("SystemExit: failed importing {}".format(mname))
-        except ImportError:
-            print("ImportError: failed importing {}".format(mname))
 
-    if missing_doc:
-        return missing_doc
+# -----------------------------------------------------------------------------
+def _glob_filter(spec):
+    """
+    Turn the *filter* argument of iglob_many() into a predicate on entries,
+    or None if there is nothing to filter
+    """
+    if spec is None or callable(spec):
+        return spec
+    unknown = set(spec) - {'min_size', 'max_size', 'newer', 'type', 'test'}
+    if unknown:
+        raise Error("Unknown filter key(s): {}".format(
+            ", ".join(sorted(unknown))))
+    tests = []
+    if 'type' in spec:
+        kinds = {spec['type']} if isinstance(spec['type'], str) \
+            else set(spec['type'])
+        if kinds - {'file', 'dir', 'link'}:
+            raise Error("Unknown filter type(s): {}".format(
+                ", ".join(sorted(kinds - {'file', 'dir', 'link'}))))
+        tests.append(functools.partial(_glob_type, kinds))
+    if spec.get('min_size') is not None:
+        tests.append(lambda entry: spec['min_size'] <= entry.stat().st_size)
+    if spec.get('max_size') is not None:
+        tests.append(lambda entry: entry.stat().st_size <= spec['max_size'])
+    if spec.get('newer') is not None:
+        newer = spec['newer']
+        mtime_ns = os.stat(newer).st_mtime_ns if isinstance(newer, str) \
+            else int(newer * 1e9)
+        tests.append(lambda entry: mtime_ns < entry.stat().st_mtime_ns)
+    if spec.get('test') is not None:
+        tests.append(spec['test'])
+    if len(tests) == 1:
+        return tests[0]
+    return functools.partial(_glob_all, tests)
 
 
 # -----------------------------------------------------------------------------
-def doc_missing(obj):
+def _glob_all(tests, entry):
     """
-    The doc string is considered missing if there is no __doc__ element or if
-    *obj*.__doc__ is None. Note that a blank or empty doc string ("", " ") is
-    not considered missing.
+    Return True if every one of *tests* accepts *entry*, stopping at the
+    first that doesn't
     """
-    if not hasattr(obj, '__doc__') or obj.__doc__ is None:
-        return True
-    else:
-        return False
+    for test in tests:
+        if not test(entry):
+            return False
+    return True
 
 
 # -----------------------------------------------------------------------------
-def my_name():
+def _glob_type(kinds, entry):
     """
-    Return the name of the caller.
-
-    Example:
-        me = tbx.my_name()
-        print("{} says 'hello!'", me)
+    Return True if *entry* is of one of the *kinds* ('file', 'dir', or
+    'link') a filter asks for. Symbolic links are only 'link'.
     """
-    return inspect.stack()[1].function
+    if 'file' in kinds and entry.is_file(follow_symlinks=False):
+        return True
+    if 'dir' in kinds and entry.is_dir(follow_symlinks=False):
+        return True
+    return 'link' in kinds and entry.is_symlink()
 
 
 # -----------------------------------------------------------------------------
-def randomize(ref=None, direction=None, window=None):
+def _glob_keep(keep, path, entry, cache):
     """
-    Return a random integer value based on REF, DIRECTION, and WINDOW.
+    Return True if predicate *keep* accepts *path*, whose os.DirEntry is
+    *entry* (None for paths that weren't found by listing). A DirEntry from
+    GlobCache *cache* has type information that is still good, but stat()
+    information that might not be, so it is replaced by a _GlobEntry that
+    stat()s afresh.
+    """
+    if keep is None:
+        return True
+    if entry is None or cache is not None:
+        entry = _GlobEntry(path, entry)
+    try:
+        return bool(keep(entry))
+    except OSError:
+        return False
 
-    DIRECTION should be +1, -1, or 0 to indicate whether the random value
-    should be above, below, or centered on REF.
 
-    WINDOW indicates how far away from REF generated random values can fall.
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=256)
+def _glob_after(rest, star):
     """
-    ref = int(ref + 0.5) or 0
-    direction = int(direction) or 0
-    window = int(window) or 100
-    if 0 < direction:
-        high = ref + window
-        low = ref
-    elif direction < 0:
-        high = ref
-        low = ref - window
-    else:
-        high = ref + (window / 2)
-        low = ref - (window / 2)
-    return random.randint(low, high)
+    Once a path has matched a component (*star* says whether it was '**'),
+    leaving components *rest*, return (done, slash, deeper): whether the
+    path itself is a match, whether it is one with a separator appended if
+    it's a directory, and whether the walk goes on into it if it's a
+    directory. As with glob, a path matched by '**' is generated as is,
+    while one followed by a trailing '**' gets the separator. '**' doesn't
+    descend into symbolic links to directories, so a link cycle can't trap
+    it.
+    """
+    after = {comps for (_, comps) in _glob_expand({(0, rest)})}
+    done = rest == () or (star and () in after)
+    slash = not star and rest != () and () in after
+    return (done, slash, bool(after - {()}))
 
 
 # -----------------------------------------------------------------------------
-def revnumerate(sequence):
+def _glob_expand(states):
     """
-    Enumerate *sequence* in reverse
+    Return the set of *states*, plus the states reached by letting each
+    leading '**' match no directories at all
     """
-    idx = len(sequence) - 1
-    for item in reversed(sequence):
-        yield idx, item
-        idx -= 1
+    rval = set()
+    todo = list(states)
+    while todo:
+        state = todo.pop()
+        if state not in rval:
+            rval.add(state)
+            (idx, comps) = state
+            if comps and comps[0] == '**':
+                todo.append((idx, comps[1:]))
+    return rval
 
 
 # -----------------------------------------------------------------------------
-def run(cmd, input=None, output=None):
+def _glob_list(dirpath):
+    """
+    Return the entries of directory *dirpath*, or [] if it can't be listed
     """
-    Run *cmd* in a separate process. Return stdout + stderr.
+    try:
+        return list(os.scandir(dirpath or os.curdir))
+    except OSError:
+        return []
 
-    If *input* is an io.StringIO, its contents will be used as stdin for the
-    child process.
 
-    If *input* is a str beginning with '<', the following text will be treated
-    as a file name and that file will be opened and read as the child's stdin.
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=256)
+def _glob_matcher(comp):
+    """
+    Return a function that says whether a name matches wildcard component
+    *comp*. As with glob, a name starting with '.' only matches a component
+    that does too, and never matches '**'.
+    """
+    if comp == '**':
+        return lambda name: name[:1] != '.'
+    regex = re.compile(fnmatch.translate(comp)).match
+    if comp.startswith('.'):
+        return regex
+    return lambda name: name[:1] != '.' and regex(name)
 
-    If *input* is a str ending with '|', the preceding text will be treated as
-    a command and the child's stdin will come from the command's stdout.
 
-    If *input* is an int (file descriptor) or a file, it will be used as stdin
+# -----------------------------------------------------------------------------
+def isnum_str(inp):
+    """
+    Return True if the string input *inp* contains only whitespace and digits
+    """
+    if not isinstance(inp, str):
+        return False
+    elif re.match(r"^\s*\d+\s*$", inp):
+        return True
+    else:
+        return False
+
+
+# -----------------------------------------------------------------------------
+def lglob(*args, dupl_allowed=False, dedupe_by='path', sort=False,
+          workers=None, cache=None, filter=None, exclude=None):
+    """
+    glob a list of paths and return the results in a single list. '**'
+    matches any number of directories (see iglob_many()).
+
+    Unless *dupl_allowed* is True, each path appears once, where it was
+    first found. With *dedupe_by* 'realpath', paths that resolve to the same
+    place through symbolic links count as the same, and with 'inode', so do
+    hard links to the same file (paths that can't be stat'd are compared as
+    they are). If *sort* is True, the list is sorted; if it is a function,
+    it is used as the sort key. *workers*, *cache*, *filter*, and *exclude*
+    are passed to iglob_many().
+    """
+    rval = iglob_many(*args, workers=workers, cache=cache, filter=filter,
+                      exclude=exclude)
+    if not dupl_allowed:
+        rval = _unique(rval, dedupe_by)
+    if sort:
+        return sorted(rval, key=None if sort is True else sort)
+    return list(rval)
+
+
+# -----------------------------------------------------------------------------
+def _unique(paths, dedupe_by):
+    """
+    Generate the first of each group of *paths* that are the same according
+    to *dedupe_by* ('path', 'realpath', or 'inode') for lglob()
+    """
+    if dedupe_by not in ('path', 'realpath', 'inode'):
+        raise Error("Unknown dedupe_by '{}'".format(dedupe_by))
+    seen = set()
+    for path in paths:
+        key = path
+        if dedupe_by == 'realpath':
+            key = osp.realpath(path)
+        elif dedupe_by == 'inode':
+            try:
+                stat = os.stat(path)
+                key = (stat.st_dev, stat.st_ino)
+            except OSError:
+                pass
+        if key not in seen:
+            seen.add(key)
+            yield path
+
+
+# -----------------------------------------------------------------------------
+def collect_missing_docs(treeroot, ignore_l=None, static=False,
+                         workers=None, cache=None, stats=None, detail=False,
+                         exclude=None):
+    """
+    Find all python files in a directory tree and report any functions/methods
+    that have no doc string or an undefined one.
+
+    The tree is walked with walk(), skipping what *exclude* matches. By
+    default, that is setup.py and directories named venv*, .*,
+    __pycache__, or *egg-info*. A file's module name comes from its path
+    relative to *treeroot* (a/b/c.py is a.b.c, and a/b/__init__.py is a.b).
+
+    Normally, each file is imported and its members are inspected. If
+    *static* is True, each file is parsed with ast instead and the classes,
+    methods, and functions defined in it are checked, so no code in the tree
+    is run. That is much faster and is safe for code that can't be trusted
+    (or that has side effects when imported). The result has the same form
+    either way, except that importing also finds functions a module
+    imports from elsewhere and methods a class inherits, while parsing
+    finds definitions in every branch of an if or try (not just the one
+    that would run) and takes a method with any decorator but classmethod
+    or a property one to still be a function, as it usually is.
+
+    If *workers* is more than 1, the files are scanned by a pool of that
+    many processes, handed out in chunks to keep the overhead down. The
+    results are merged in the order of the files, so they are the same as
+    a serial scan gives.
+
+    With *static*, *cache* can name a file in which to keep each file's
+    results from one run to the next (if it is True, .tbx-doc-cache.jsonl
+    in *treeroot* is used). A file whose size and mtime, or failing that
+    whose SHA-1, match what was cached isn't scanned again. If *stats* is a
+    dict, the number of files found, cache hits, and files scanned are
+    stored in it under 'files', 'hits', and 'scanned'.
+
+    If *detail* is True, a list of MissingDoc records is returned instead of
+    names. Each gives the module, qualified name, line number, and kind
+    ('class', 'method', or 'function') of a definition that has no doc
+    string, and the same name in different modules is reported for each of
+    them. Either way, repeats are dropped and the first one found is kept.
+    """
+    if cache is True:
+        cache = osp.join(treeroot, '.tbx-doc-cache.jsonl')
+    if cache and not static:
+        raise Error('cache is only valid with static=True')
+    ignore_l = ignore_l or []
+    exclude = _DOC_EXCLUDE if exclude is None else exclude
+    importables = []
+    rels = []
+    for rel in walk(treeroot, exclude=exclude, include='*.py'):
+        parts = rel[:-3].split(os.sep)
+        if parts[-1] == '__init__':
+            parts = parts[:-1] or [osp.basename(osp.abspath(treeroot))]
+        importables.append(('.'.join(parts), osp.join(treeroot, rel)))
+        rels.append(rel)
+
+    results = [None] * len(importables)
+    if cache:
+        old = _doc_cache_load(cache)
+        records = []
+        for (idx, (mname, path)) in enumerate(importables):
+            record = _doc_cache_record(old.get(rels[idx]), rels[idx], mname,
+                                       path, ignore_l)
+            records.append(record)
+            if 'found' in record:
+                results[idx] = [MissingDoc(*_) for _ in record['found']]
+    todo = [_ for _ in range(len(importables)) if results[_] is None]
+
+    scan = functools.partial(_doc_scan, ignore_l=ignore_l, static=static)
+    items = [importables[_] for _ in todo]
+    if workers is not None and 1 < workers and 1 < len(items):
+        chunk = max(1, len(items) // (4 * workers))
+        from concurrent import futures
+        with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            found = list(pool.map(scan, items, chunksize=chunk))
+    else:
+        found = [scan(_) for _ in items]
+    for (idx, names) in zip(todo, found):
+        results[idx] = names
+
+    if cache:
+        for idx in todo:
+            records[idx]['found'] = [list(_) for _ in results[idx]]
+        _doc_cache_save(cache, records)
+    if stats is not None:
+        stats.update({'files': len(importables),
+                      'hits': len(importables) - len(todo),
+                      'scanned': len(todo)})
+
+    missing_doc = collections.OrderedDict()
+    for found in results:
+        for item in found:
+            key = item[:2] if detail else item.name
+            if key not in missing_doc:
+                missing_doc[key] = item if detail else item.name
+
+    if missing_doc:
+        return list(missing_doc.values())
+
+
+# -----------------------------------------------------------------------------
+def _doc_cache_load(cachefile):
+    """
+    Read the records in collect_missing_docs() cache *cachefile* into a dict
+    by relative path. A missing file is an empty cache, and lines that
+    can't be read are skipped.
+    """
+    rval = {}
+    try:
+        with open(cachefile, 'r') as rbl:
+            for line in rbl:
+                try:
+                    record = json.loads(line)
+                    rval[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    pass
+    except FileNotFoundError:
+        pass
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _doc_cache_record(record, rel, mname, path, ignore_l):
+    """
+    Return the cache record for file *path* (*rel* relative to the tree
+    root, holding module *mname*). If the cached *record* still applies, it
+    is returned with its 'found' results; otherwise a new record without
+    them is. The file is only hashed when its size or mtime has changed.
+    """
+    stat = os.stat(path)
+    key = {'version': _DOC_CACHE_VERSION, 'path': rel, 'mname': mname,
+           'ignore': sorted(ignore_l), 'size': stat.st_size,
+           'mtime_ns': stat.st_mtime_ns}
+    same = record is not None and 'found' in record and \
+        all(record.get(_) == key[_]
+            for _ in ('version', 'path', 'mname', 'ignore'))
+    if same and (record['size'], record['mtime_ns']) == \
+       (key['size'], key['mtime_ns']):
+        return record
+    with open(path, 'rb') as rbl:
+        key['sha1'] = hashlib.sha1(rbl.read()).hexdigest()
+    if same and record.get('sha1') == key['sha1']:
+        key['found'] = record['found']
+    return key
+
+
+# -----------------------------------------------------------------------------
+def _doc_cache_save(cachefile, records):
+    """
+    Replace collect_missing_docs() cache *cachefile* with *records*, one
+    JSON object per line. The new file is written beside the old one and
+    renamed over it, so a reader never sees it half written.
+    """
+    tmpname = "{}.{}".format(cachefile, os.getpid())
+    with open(tmpname, 'w') as wbl:
+        for record in records:
+            wbl.write(json.dumps(record, sort_keys=True) + "\n")
+    os.replace(tmpname, cachefile)
+
+
+# -----------------------------------------------------------------------------
+def _doc_scan(item, ignore_l, static):
+    """
+    Scan one (module name, path) *item* for collect_missing_docs(), by
+    parsing it if *static* or else by importing it
+    """
+    (mname, path) = item
+    if static:
+        return _doc_scan_static(mname, path, ignore_l)
+    return _doc_scan_import(mname, ignore_l)
+
+
+# -----------------------------------------------------------------------------
+def _doc_scan_import(mname, ignore_l):
+    """
+    Import module *mname* and return MissingDoc records for its classes
+    (other than those in *ignore_l*), their methods, and its functions that
+    have no doc string
+    """
+    rval = []
+    classes = None
+    try:
+        mod = import_module(mname)
+
+        for name, obj in inspect.getmembers(mod, inspect.isclass):
+            if name in ignore_l:
+                continue
+            if doc_missing(obj):
+                if classes is None:
+                    classes = _doc_class_lines(mod)
+                rval.append(MissingDoc(mname, name,
+                                       _doc_lineno(obj, mod, classes),
+                                       'class'))
+
+            for mthname, mthobj in inspect.getmembers(obj,
+                                                      inspect.isfunction):
+                if doc_missing(mthobj):
+                    rval.append(MissingDoc(mname,
+                                           "{}.{}".format(name, mthname),
+                                           _doc_lineno(mthobj), 'method'))
+
+        for name, obj in inspect.getmembers(mod, inspect.isfunction):
+            if doc_missing(obj):
+                rval.append(MissingDoc(mname, name, _doc_lineno(obj),
+                                       'function'))
+
+    except SystemExit:
+        print("SystemExit: failed importing {}".format(mname))
+    except ImportError:
+        print("ImportError: failed importing {}".format(mname))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _doc_lineno(obj, mod=None, classes=None):
+    """
+    Return the line number where class or function *obj* is defined, or
+    None if it can't be found cheaply. A function knows its own. A class
+    knows it from Python 3.13 on; before that, one defined in module *mod*
+    is looked up by qualified name in *classes* (see _doc_class_lines()),
+    and one defined elsewhere gets None.
+    """
+    try:
+        return obj.__code__.co_firstlineno
+    except AttributeError:
+        pass
+    lineno = getattr(obj, '__firstlineno__', None)
+    if lineno is None and mod is not None and \
+       getattr(obj, '__module__', None) == mod.__name__:
+        lineno = classes.get(obj.__qualname__)
+    return lineno
+
+
+# -----------------------------------------------------------------------------
+def _doc_class_lines(mod):
+    """
+    Parse the source of module *mod* once and return the line numbers of
+    the classes defined in it by qualified name, or {} if there is no
+    source to parse
+    """
+    rval = {}
+    try:
+        with open(mod.__file__, 'rb') as rbl:
+            todo = [('', ast.parse(rbl.read()))]
+    except (AttributeError, TypeError, OSError, SyntaxError, ValueError):
+        return rval
+    while todo:
+        (prefix, node) = todo.pop()
+        for (name, child) in _ast_defs(node, (ast.ClassDef,)).items():
+            rval[prefix + name] = child.lineno
+            todo.append((prefix + name + '.', child))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _doc_scan_static(mname, path, ignore_l):
+    """
+    Parse file *path*, holding module *mname*, and return what
+    _doc_scan_import() would for the classes, methods, and functions
+    defined in it, in the same order (by name, as inspect.getmembers()
+    gives them)
+    """
+    rval = []
+    try:
+        with open(path, 'rb') as rbl:
+            tree = ast.parse(rbl.read(), filename=path)
+    except (SyntaxError, ValueError):
+        print("SyntaxError: failed parsing {}".format(path))
+        return rval
+
+    funcs = (ast.FunctionDef, ast.AsyncFunctionDef)
+    classes = _ast_defs(tree, (ast.ClassDef,))
+    for name in sorted(classes):
+        if name in ignore_l:
+            continue
+        if ast.get_docstring(classes[name], clean=False) is None:
+            rval.append(MissingDoc(mname, name, classes[name].lineno,
+                                   'class'))
+        methods = _ast_defs(classes[name], funcs)
+        for mthname in sorted(methods):
+            if not _ast_function(methods[mthname]):
+                continue
+            if ast.get_docstring(methods[mthname], clean=False) is None:
+                rval.append(MissingDoc(mname, "{}.{}".format(name, mthname),
+                                       methods[mthname].lineno, 'method'))
+
+    functions = _ast_defs(tree, funcs)
+    for name in sorted(functions):
+        if ast.get_docstring(functions[name], clean=False) is None:
+            rval.append(MissingDoc(mname, name, functions[name].lineno,
+                                   'function'))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _ast_defs(node, kinds):
+    """
+    Return a dict of the definitions of *kinds* in the body of ast *node*,
+    by name, including those nested in if, try, with, for, while, and match
+    statements. As at run time, a later definition replaces an earlier one.
+    """
+    return {_.name: _ for _ in _ast_stmts(node.body) if isinstance(_, kinds)}
+
+
+# -----------------------------------------------------------------------------
+def _ast_stmts(body):
+    """
+    Generate the statements in *body*, a list of ast nodes, in order,
+    descending into the blocks of compound statements but not into function
+    or class definitions
+    """
+    for stmt in body:
+        yield stmt
+        if isinstance(stmt, _AST_SCOPES):
+            continue
+        for field in ('body', 'handlers', 'cases', 'orelse', 'finalbody'):
+            for child in getattr(stmt, field, ()):
+                if isinstance(child, ast.stmt):
+                    yield from _ast_stmts([child])
+                else:
+                    yield from _ast_stmts(child.body)
+
+
+# -----------------------------------------------------------------------------
+def _ast_function(node):
+    """
+    Return False if method *node* is decorated as a classmethod or a
+    property (or a property's getter, setter, or deleter), which
+    inspect.getmembers() doesn't count as a function on the class, or True
+    otherwise
+    """
+    for deco in node.decorator_list:
+        if isinstance(deco, ast.Call):
+            deco = deco.func
+        name = getattr(deco, 'id', getattr(deco, 'attr', None))
+        if name in _AST_NONFUNCS:
+            return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+def doc_missing(obj):
+    """
+    The doc string is considered missing if there is no __doc__ element or if
+    *obj*.__doc__ is None. Note that a blank or empty doc string ("", " ") is
+    not considered missing.
+    """
+    if not hasattr(obj, '__doc__') or obj.__doc__ is None:
+        return True
+    else:
+        return False
+
+
+# -----------------------------------------------------------------------------
+def my_name():
+    """
+    Return the name of the caller.
+
+    Example:
+        me = tbx.my_name()
+        print("{} says 'hello!'", me)
+    """
+    return inspect.stack()[1].function
+
+
+# -----------------------------------------------------------------------------
+def pipeline(cmds, input=None, output=None):
+    """
+    Run the commands in list *cmds* as a pipeline, like 'cmd1 | cmd2 | ...'
+    in the shell. Every stage is started at once and each one's stdout +
+    stderr is connected to the next one's stdin with an OS pipe, so the data
+    flows from process to process without passing through Python.
+
+    *input* feeds the first stage and *output* receives the last stage's
+    stdout. Both accept the same forms as they do for run(), including
+    input='cmd |' and output='| cmd', which add a stage at either end.
+
+    Returns (out, status) where out is the last stage's output, as run()
+    would return it, and status is a list of the stages' exit codes in
+    pipeline order.
+    """
+    (result, status) = _execute(cmds, cmds, input, output, False)
+    return (result.stdout, status)
+
+
+# -----------------------------------------------------------------------------
+def randomize(ref=None, direction=None, window=None):
+    """
+    Return a random integer value based on REF, DIRECTION, and WINDOW.
+
+    DIRECTION should be +1, -1, or 0 to indicate whether the random value
+    should be above, below, or centered on REF.
+
+    WINDOW indicates how far away from REF generated random values can fall.
+    """
+    ref = int(ref + 0.5) or 0
+    direction = int(direction) or 0
+    window = int(window) or 100
+    if 0 < direction:
+        high = ref + window
+        low = ref
+    elif direction < 0:
+        high = ref
+        low = ref - window
+    else:
+        high = ref + (window / 2)
+        low = ref - (window / 2)
+    return random.randint(low, high)
+
+
+# -----------------------------------------------------------------------------
+def revnumerate(sequence):
+    """
+    Enumerate *sequence* in reverse
+    """
+    idx = len(sequence) - 1
+    for item in reversed(sequence):
+        yield idx, item
+        idx -= 1
+
+
+# -----------------------------------------------------------------------------
+def run(cmd, input=None, output=None, result=False, timeout=None,
+        max_output_bytes=None, overflow='truncate', rlimits=None):
+    """
+    Run *cmd* in a separate process. Return stdout + stderr, or a RunResult
+    if *result* is True.
+
+    *cmd* is either a string, which is split into arguments with shlex, or a
+    list or tuple of arguments, which is used as is. The list form skips the
+    parsing and is the faster choice when running many short commands.
+
+    If *input* is an io.StringIO, its contents will be used as stdin for the
+    child process.
+
+    If *input* is a str beginning with '<', the following text will be treated
+    as a file name and that file will be opened and read as the child's stdin.
+
+    If *input* is a str ending with '|', the preceding text will be treated as
+    a command and the child's stdin will come from the command's stdout. The
+    two commands run concurrently, connected by an OS pipe.
+
+    If *input* is an int (file descriptor) or a file, it will be used as stdin
     for the child process.
 
     If *output* is a str beginning with '>', the following text will be treated
     as a file name and that file will be opened to receive child's stdout.
 
     If *output* is a str beginning with '|', the following text will be treated
-    as a command and child's stdout will be connected to the command's stdin.
+    as a command and child's stdout will be connected to the command's stdin
+    by an OS pipe. The command's output is returned.
 
     If *output* is a file descriptor (int) or file, it will be used to receive
     child's stdout.
+
+    If *result* is True, stderr is captured separately from stdout (for a
+    pipeline, every stage's stderr is collected together) and a RunResult
+    carrying both, along with the exit code, pid, and timing and CPU usage of
+    the command, is returned.
+
+    If *timeout* is not None and the command has not finished within that
+    many seconds, it is killed and sproc.TimeoutExpired is raised.
+
+    If *max_output_bytes* is not None, at most that many bytes of output (and
+    of stderr, if *result* is True) are kept. With *overflow* 'truncate' (the
+    default) the rest is read and discarded so the child never blocks on a
+    full pipe. With *overflow* 'raise', the child is killed and Error is
+    raised as soon as the limit is exceeded.
+
+    *rlimits* is a dict of resource limits to set in the child, named as in
+    the resource module without the 'RLIMIT_' prefix, e.g. {'cpu': 10,
+    'as': 2**30}. A value is either the soft and hard limit or a (soft,
+    hard) tuple.
+    """
+    (rval, _) = _execute(cmd, [cmd], input, output, result, timeout,
+                         max_output_bytes, overflow, rlimits)
+    return rval if result else rval.stdout
+
+
+# -----------------------------------------------------------------------------
+def run_iter(cmd, input=None, chunk=65536):
     """
-    posarg = shlex.split(str(cmd))
-    kwa = {'stdin': sproc.PIPE,
-           'stdout': sproc.PIPE,
-           'stderr': sproc.STDOUT}
+    Run *cmd* in a separate process and return a generator that yields the
+    child's stdout + stderr as it is produced, one line at a time. Lines keep
+    their line endings, so ''.join(run_iter(cmd)) matches run(cmd).
+
+    The pipe is read incrementally, so memory use is bounded by the longest
+    line rather than by the total output. Lines longer than *chunk* bytes are
+    yielded in pieces.
 
+    *input* accepts the same forms as it does for run().
+
+    If the consumer stops iterating early (break, close(), or garbage
+    collection of the generator), the child is killed and reaped.
+    """
+    (cmds, input, _) = _stages([cmd], input, None)
+    (children, input) = _launch(cmds, input, None)
+    feeder = _start_feed(children[0], input)
+    source = children[-1].stdout
+
+    decoder = codecs.getincrementaldecoder('utf8')()
+    try:
+        while True:
+            data = source.readline(chunk)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+    finally:
+        source.close()
+        _reap(children, feeder)
+
+
+# -----------------------------------------------------------------------------
+def run_many(cmds, max_workers=None, ordered=True):
+    """
+    Run the commands in *cmds* concurrently, with at most *max_workers* (by
+    default, the number of CPUs) running at any one time. Each item of *cmds*
+    is either a command string or a dict of run() keyword arguments with the
+    command under key 'cmd', so per-command input= and output= redirection
+    works just as it does for run().
+
+    Returns an iterator of RunResult objects. If *ordered* is True, results
+    come back in the order of *cmds*. Otherwise, each result is produced as
+    soon as its command finishes.
+
+    The commands are handed to the pool when run_many() is called, so they
+    start running whether or not the results are ever looked at. If a
+    command cannot be started, the exception is raised when its result is
+    reached. If the caller stops iterating early, commands that have not
+    started yet are cancelled.
+    """
+    from concurrent import futures
+    workers = max_workers or os.cpu_count() or 1
+    pool = futures.ThreadPoolExecutor(max_workers=workers)
+    pending = [pool.submit(_run_one, _) for _ in cmds]
+    return _run_results(pool, pending, ordered)
+
+
+# -----------------------------------------------------------------------------
+def _run_results(pool, pending, ordered):
+    """
+    Generate the results of the *pending* futures of run_many(), in order or
+    as they finish, and shut *pool* down when done or abandoned
+    """
+    from concurrent import futures
+    try:
+        if ordered:
+            for future in pending:
+                yield future.result()
+        else:
+            for future in futures.as_completed(pending):
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+# -----------------------------------------------------------------------------
+def _run_one(item):
+    """
+    Run a single command for run_many() and return its RunResult
+    """
+    if isinstance(item, dict):
+        kwa = dict(item)
+        cmd = kwa.pop('cmd')
+    else:
+        (cmd, kwa) = (item, {})
+    return run(cmd, result=True, **kwa)
+
+
+# -----------------------------------------------------------------------------
+def _argv(cmd):
+    """
+    Turn *cmd* into (argv, executable) for Popen. A list or tuple is taken as
+    an already split argument list; anything else is split with shlex. If
+    argv[0] is a bare name, executable is its absolute path on $PATH (looked
+    up through a cache), or None to let Popen search for it.
+    """
+    if isinstance(cmd, (list, tuple)):
+        argv = [str(_) for _ in cmd]
+    else:
+        argv = shlex.split(str(cmd))
+    executable = None
+    if argv and '/' not in argv[0]:
+        executable = _which(argv[0], os.environ.get('PATH', os.defpath))
+    return (argv, executable)
+
+
+# -----------------------------------------------------------------------------
+def _communicate(children, data, errfd, deadline=None, limit=None,
+                 overflow='truncate'):
+    """
+    Write *data* to the stdin of the first of *children* while collecting the
+    stdout of the last one and, if *errfd* is not None, their shared stderr
+    pipe. A selector multiplexes the pipes so no one of them can fill up and
+    deadlock the others. Returns (out, err) as bytes, each None if not
+    collected.
+
+    If *deadline* (a time.monotonic() value) passes first, raise
+    sproc.TimeoutExpired. If *limit* is not None, keep at most that many bytes
+    from each pipe. Once a pipe goes over, an *overflow* of 'truncate' means
+    the rest is read and discarded so the writer never blocks, while 'raise'
+    means raise Error right away.
+    """
+    first = children[0]
+    last = children[-1]
+    chunks = {}
+    room = {}
+    cut = set()
+    with selectors.DefaultSelector() as sel:
+        if last.stdout:
+            chunks[last.stdout.fileno()] = []
+        if errfd is not None:
+            chunks[errfd] = []
+        for fd in chunks:
+            room[fd] = limit
+            sel.register(fd, selectors.EVENT_READ)
+        if first.stdin:
+            if data:
+                view = memoryview(data)
+                sel.register(first.stdin, selectors.EVENT_WRITE)
+            else:
+                first.stdin.close()
+
+        while sel.get_map():
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    raise sproc.TimeoutExpired(None, None)
+            for (key, _) in sel.select(wait):
+                if key.fileobj is first.stdin:
+                    try:
+                        sent = os.write(key.fd, view[:select.PIPE_BUF])
+                        view = view[sent:]
+                    except BrokenPipeError:
+                        view = view[:0]
+                    if not view:
+                        sel.unregister(key.fileobj)
+                        first.stdin.close()
+                    continue
+
+                chunk = os.read(key.fd, 32768)
+                if not chunk:
+                    sel.unregister(key.fd)
+                elif room[key.fd] is None:
+                    chunks[key.fd].append(chunk)
+                elif len(chunk) <= room[key.fd]:
+                    chunks[key.fd].append(chunk)
+                    room[key.fd] -= len(chunk)
+                elif overflow == 'raise':
+                    raise Error("Output exceeded {} bytes".format(limit))
+                else:
+                    chunks[key.fd].append(chunk[:room[key.fd]])
+                    room[key.fd] = 0
+                    cut.add(key.fd)
+
+    out = err = None
+    if last.stdout:
+        fd = last.stdout.fileno()
+        out = _utf8_trim(b''.join(chunks[fd]), fd in cut)
+        last.stdout.close()
+    if errfd is not None:
+        err = _utf8_trim(b''.join(chunks[errfd]), errfd in cut)
+    return (out, err)
+
+
+# -----------------------------------------------------------------------------
+def _utf8_trim(data, cut):
+    """
+    If *cut* (*data* was truncated), drop any partial UTF-8 character from
+    the end of *data* so it still decodes. The cut can fall anywhere, even
+    at the end of a read that filled the limit exactly, so this is done on
+    the joined bytes.
+    """
+    if not cut:
+        return data
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            need = 1 if byte < 0xC0 else 2 if byte < 0xE0 else \
+                3 if byte < 0xF0 else 4
+            return data[:-back] if back < need else data
+    return data
+
+
+# -----------------------------------------------------------------------------
+def _execute(cmd, cmds, input, output, split, timeout=None, limit=None,
+             overflow='truncate', rlimits=None):
+    """
+    Run the pipeline in *cmds* with *input* and *output* as described for
+    run(). If *split* is True, stderr is collected apart from stdout.
+    *timeout*, *limit* (max_output_bytes), *overflow*, and *rlimits* are as
+    described for run().
+
+    The children are reaped with os.wait4() so their resource usage can be
+    reported. Returns (RunResult, status) where the RunResult describes the
+    pipeline as a whole under the name *cmd* and status is the list of the
+    stages' exit codes.
+    """
+    if overflow not in ('truncate', 'raise'):
+        raise Error("overflow must be 'truncate' or 'raise'")
+    preexec = _rlimiter(rlimits)
+    (cmds, input, output) = _stages(cmds, input, output)
+    errfd = errw = None
+    if split:
+        (errfd, errw) = os.pipe()
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    try:
+        (children, data) = _launch(cmds, input, output,
+                                   sproc.STDOUT if errw is None else errw,
+                                   preexec)
+    except BaseException:
+        if errfd is not None:
+            os.close(errfd)
+        raise
+    finally:
+        if errw is not None:
+            os.close(errw)
+    spawned = time.monotonic()
+
+    try:
+        (out, err) = _communicate(children, data, errfd, deadline, limit,
+                                  overflow)
+        usage = [_wait4(_, deadline) for _ in children]
+    except sproc.TimeoutExpired as exc:
+        exc.cmd = cmd
+        exc.timeout = timeout
+        raise
+    finally:
+        _reap(children, None)
+        if errfd is not None:
+            os.close(errfd)
+
+    rval = RunResult(cmd,
+                     stdout=_run_result(output, out),
+                     stderr=None if err is None else err.decode(),
+                     returncode=children[-1].returncode,
+                     pid=children[-1].pid,
+                     spawn=spawned - start,
+                     wall=time.monotonic() - start,
+                     utime=sum(_.ru_utime for _ in usage),
+                     stime=sum(_.ru_stime for _ in usage))
+    return (rval, [_.returncode for _ in children])
+
+
+# -----------------------------------------------------------------------------
+def _feed(pipe, data):
+    """
+    Write *data* to *pipe*, then close it. Meant to run in its own thread so
+    the caller can read the child's output while the child reads its input.
+    """
+    try:
+        pipe.write(data)
+    except (BrokenPipeError, ValueError):
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+# -----------------------------------------------------------------------------
+def _launch(cmds, input, output, stderr=sproc.STDOUT, preexec=None):
+    """
+    Start every command in *cmds* at once, connecting each one's stdout +
+    stderr to the next one's stdin with an OS pipe. The first command reads
+    from *input* and the last writes to *output* (see run()). If *stderr* is
+    not sproc.STDOUT, every command's stderr goes there instead. *preexec*,
+    if not None, is called in each child before it execs. Returns
+    (children, data) where data is the bytes still to be written to the first
+    child's stdin, or None.
+
+    The children are started with an absolute executable path (see _argv())
+    and _SPAWN_KW, so Popen can avoid a full fork() where the platform
+    allows.
+
+    If a command cannot be started, the ones already running are killed
+    before the exception propagates.
+    """
+    opened = []
+    children = []
+    try:
+        stdout = _run_output(output, opened)
+        (stdin, data) = _run_input(input, opened)
+        for idx, cmd in enumerate(cmds):
+            last = idx == len(cmds) - 1
+            (argv, executable) = _argv(cmd)
+            child = sproc.Popen(argv,
+                                executable=executable,
+                                stdin=stdin,
+                                stdout=stdout if last else sproc.PIPE,
+                                stderr=stderr,
+                                preexec_fn=preexec,
+                                **_SPAWN_KW)
+            if children:
+                # the parent's copy of the pipe is no longer needed; closing
+                # it lets SIGPIPE reach the writer if the reader exits early
+                children[-1].stdout.close()
+            children.append(child)
+            stdin = child.stdout
+    except BaseException:
+        _reap(children, None)
+        raise
+    finally:
+        for fobj in opened:
+            fobj.close()
+    return (children, data)
+
+
+# -----------------------------------------------------------------------------
+def _reap(children, feeder):
+    """
+    Kill any of *children* that are still running, wait for all of them, and
+    join the *feeder* thread, if there is one.
+    """
+    for child in children:
+        if child.poll() is None:
+            child.kill()
+        for pipe in (child.stdin, child.stdout):
+            if pipe:
+                pipe.close()
+        child.wait()
+    if feeder:
+        feeder.join()
+
+
+# -----------------------------------------------------------------------------
+def _rlimiter(rlimits):
+    """
+    Turn the *rlimits* argument of run() into a function that applies the
+    limits in the child process, or None if there are none. The names are
+    checked here, in the parent, so a typo raises Error instead of failing
+    inside the child.
+    """
+    if not rlimits:
+        return None
+    if resource is None:
+        raise Error("rlimits are not supported on this platform")
+    limits = []
+    for name, value in rlimits.items():
+        which = getattr(resource, 'RLIMIT_' + name.upper(), None)
+        if which is None:
+            raise Error("Unknown rlimit '{}'".format(name))
+        if isinstance(value, int):
+            value = (value, value)
+        limits.append((which, tuple(value)))
+
+    def apply():
+        """
+        Set the limits in the child, after fork and before exec
+        """
+        for which, value in limits:
+            resource.setrlimit(which, value)
+
+    return apply
+
+
+# -----------------------------------------------------------------------------
+def _run_input(input, opened):
+    """
+    Resolve the *input* argument of run() and friends. Returns (stdin, data)
+    where stdin is suitable for Popen(stdin=...) and data is the bytes to be
+    written to the child's stdin, or None. A file opened here is appended to
+    *opened* so the caller can close it after the spawn. The 'cmd |' form is
+    handled by _stages() before we get here.
+    """
     if isinstance(input, io.StringIO):
-        input = input.getvalue()
+        return sproc.PIPE, bytes(input.getvalue(), 'utf8')
     elif isinstance(input, str):
         if input.strip().startswith('<'):
-            kwa['stdin'] = open(input.strip()[1:].strip())
-            input = None
-        elif input.strip().endswith('|'):
-            scmd = input.strip()[:-1].strip()
-            input = run(scmd)
+            opened.append(open(input.strip()[1:].strip()))
+            return opened[-1], None
+        return sproc.PIPE, bytes(input, 'utf8')
+    elif isinstance(input, bytes):
+        return sproc.PIPE, input
     elif isinstance(input, int):
-        kwa['stdin'] = input
-        input = None
+        return input, None
     elif isinstance(input, file):
-        kwa['stdin'] = input
-        input = None
+        return input, None
+    return sproc.PIPE, None
 
+
+# -----------------------------------------------------------------------------
+def _run_output(output, opened):
+    """
+    Resolve the *output* argument of run() and friends into something suitable
+    for Popen(stdout=...). A file opened here is appended to *opened*. The
+    '| cmd' form is handled by _stages() before we get here.
+    """
     if isinstance(output, str):
         if output.strip().startswith('>'):
-            kwa['stdout'] = open(output.strip()[1:].strip(), 'w')
-        elif output.strip().startswith('|'):
-            pass
-        else:
-            raise Error('| or > required for string output')
+            opened.append(open(output.strip()[1:].strip(), 'w'))
+            return opened[-1]
+        raise Error('| or > required for string output')
     elif isinstance(output, file):
-        kwa['stdout'] = output
+        return output
     elif isinstance(output, int):
-        kwa['stdout'] = output
+        return output
+    return sproc.PIPE
 
-    child = sproc.Popen(posarg, **kwa)
-    if isinstance(input, bytes):
-        (out, _) = child.communicate(input)
-    elif isinstance(input, str):
-        (out, _) = child.communicate(bytes(input, 'utf8'))
-    else:
-        (out, _) = child.communicate()
 
+# -----------------------------------------------------------------------------
+def _run_result(output, out):
+    """
+    Turn the bytes captured from the last child into what run() returns: a
+    str, or None if *output* received the data.
+    """
     if isinstance(output, io.StringIO):
-        output.write(str(out))
-        out = None
-    elif isinstance(output, file):
-        out = None
-    elif isinstance(output, int):
+        output.write(out.decode())
         out = None
-    elif isinstance(output, str) and output.strip().startswith('|'):
-        cmd = output.strip()[1:].strip()
-        out = run(cmd, input=out)
-
     if isinstance(out, bytes):
         return out.decode()
-    elif isinstance(out, str):
-        return out
+
+
+# -----------------------------------------------------------------------------
+def _stages(cmds, input, output):
+    """
+    Peel the 'cmd |' form off *input* and the '| cmd' form off *output*,
+    turning them into extra pipeline stages. Returns (cmds, input, output)
+    with the consumed redirections replaced by None.
+    """
+    cmds = list(cmds)
+    if isinstance(input, str):
+        istr = input.strip()
+        if not istr.startswith('<') and istr.endswith('|'):
+            cmds.insert(0, istr[:-1].strip())
+            input = None
+    if isinstance(output, str) and output.strip().startswith('|'):
+        cmds.append(output.strip()[1:].strip())
+        output = None
+    return (cmds, input, output)
+
+
+# -----------------------------------------------------------------------------
+def _start_feed(child, data):
+    """
+    If there is *data* for *child*, start a thread writing it to the child's
+    stdin and return the thread. Otherwise close the child's stdin (if it is
+    a pipe) so the child sees EOF, and return None.
+    """
+    if data is None:
+        if child.stdin:
+            child.stdin.close()
+        return None
+    feeder = threading.Thread(target=_feed, args=(child.stdin, data))
+    feeder.daemon = True
+    feeder.start()
+    return feeder
+
+
+# -----------------------------------------------------------------------------
+def _wait4(child, deadline=None):
+    """
+    Reap *child* with os.wait4(), record its exit code on the Popen object the
+    way Popen.wait() would, and return its resource usage. If *deadline* (a
+    time.monotonic() value) passes first, raise sproc.TimeoutExpired.
+    """
+    if deadline is None:
+        (_, status, usage) = os.wait4(child.pid, 0)
+    else:
+        delay = 0.0005
+        while True:
+            (pid, status, usage) = os.wait4(child.pid, os.WNOHANG)
+            if pid:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise sproc.TimeoutExpired(None, None)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+    if os.WIFSIGNALED(status):
+        child.returncode = -os.WTERMSIG(status)
+    else:
+        child.returncode = os.WEXITSTATUS(status)
+    return usage
+
+
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=512)
+def _which(name, path):
+    """
+    Return the absolute path of executable *name* on search path *path*, or
+    None. Results are cached per (name, path), so changing $PATH (e.g., with
+    envset()) gets a fresh lookup. Relative hits (from a '.' entry on the
+    path) depend on the current directory, so they are not used. Call
+    _which.cache_clear() if executables move around on an unchanged $PATH.
+    """
+    found = shutil.which(name, path=path)
+    if found and osp.isabs(found):
+        return found
+    return None
 
 
 # -----------------------------------------------------------------------------
@@ -547,9 +2443,731 @@ def version():
     return verinfo._v
 
 
+# -----------------------------------------------------------------------------
+def walk(root, exclude=None, include=None, followlinks=False):
+    """
+    Generate the paths of the files in the tree under *root*, relative to
+    *root*, like a find(1) that skips what a .gitignore would. Each directory
+    is listed once with os.scandir(), its files are generated, and then the
+    walk goes on into its subdirectories in turn, the order os.walk() gives.
+    As with os.walk(), symbolic links to directories are only followed if
+    *followlinks* is True.
+
+    *exclude* and *include* are gitignore-style patterns: a list of them, or
+    a string of them one per line (so the text of a .gitignore will do),
+    where blank lines and lines starting with '#' are ignored. A pattern is
+    matched against the path relative to *root*. Without a '/' (other than
+    a trailing one), it matches the name at any depth; with one, it matches
+    from *root*. '*' and '?' don't match '/', while '**/' matches any number
+    of directories and a trailing '/**' everything below. A trailing '/'
+    matches only directories, and a leading '!' takes back what an earlier
+    pattern matched; the last pattern that matches a path decides.
+
+    Files and directories matched by *exclude* are skipped, so the walk
+    never goes into an excluded directory. If *include* is given, only the
+    files it matches are generated (it doesn't stop the walk from going
+    into directories). The patterns are compiled once, and a list of them
+    without '!' is checked with a single regex match per path.
+    """
+    skip = _walk_rules(_walk_patterns(exclude))
+    want = _walk_rules(_walk_patterns(include))
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        subdirs = []
+        for entry in _glob_list(osp.join(root, rel)):
+            path = rel + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if skip is not None and skip(path, is_dir):
+                continue
+            if not is_dir:
+                if want is None or want(path, False):
+                    yield path
+            elif followlinks or not entry.is_symlink():
+                subdirs.append(path + os.sep)
+        stack.extend(reversed(subdirs))
+
+
+# -----------------------------------------------------------------------------
+def _walk_patterns(patterns):
+    """
+    Return the gitignore-style *patterns* (None, a list, or a string of
+    lines) for walk() as a tuple, without blank lines and comments
+    """
+    if patterns is None:
+        return ()
+    if isinstance(patterns, str):
+        patterns = patterns.splitlines()
+    return tuple(_.rstrip() for _ in patterns
+                 if _.strip() and not _.startswith('#'))
+
+
+# -----------------------------------------------------------------------------
+@functools.lru_cache(maxsize=256)
+def _walk_rules(patterns):
+    """
+    Compile the tuple of gitignore-style *patterns* into a function of a
+    relative path and whether it is a directory that returns True if the
+    patterns match it, or return None if there are no patterns. Patterns
+    without a '/' are matched against the last component of the path only.
+    """
+    if not patterns:
+        return None
+    rules = []
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+        dironly = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        rules.append((_walk_regex(pattern.lstrip('/')), '/' in pattern,
+                      negate, dironly))
+
+    if not any(negate for (_, _, negate, _) in rules):
+        regexes = {}
+        for is_dir in (False, True):
+            for anchored in (False, True):
+                either = [regex for (regex, where, _, dironly) in rules
+                          if where == anchored and (is_dir or not dironly)]
+                regexes[(is_dir, anchored)] = None if not either \
+                    else re.compile('|'.join(either), re.S).fullmatch
+
+        def match(path, is_dir):
+            name = regexes[(is_dir, False)]
+            if name is not None and name(path.rpartition('/')[2]):
+                return True
+            full = regexes[(is_dir, True)]
+            return full is not None and full(path) is not None
+        return match
+
+    rules = [(re.compile(regex, re.S).fullmatch, anchored, negate, dironly)
+             for (regex, anchored, negate, dironly) in reversed(rules)]
+
+    def match(path, is_dir):
+        name = path.rpartition('/')[2]
+        for (regex, anchored, negate, dironly) in rules:
+            if (is_dir or not dironly) and regex(path if anchored else name):
+                return not negate
+        return False
+    return match
+
+
+# -----------------------------------------------------------------------------
+def _walk_regex(pattern):
+    """
+    Translate gitignore-style *pattern* (without its leading '!' and its
+    leading and trailing '/') into a regex
+    """
+    rval = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if pattern.startswith('**', idx) and pattern[idx - 1:idx] in '/' \
+           and pattern[idx + 2:idx + 3] in '/':
+            if idx + 2 == len(pattern):
+                rval.append('.*')
+            else:
+                rval.append('(?:.*/)?')
+            idx += 3
+            continue
+        if char == '*':
+            rval.append('[^/]*')
+        elif char == '?':
+            rval.append('[^/]')
+        elif char == '\\' and idx + 1 < len(pattern):
+            idx += 1
+            rval.append(re.escape(pattern[idx]))
+        elif char == '[' and 0 < pattern.find(']', idx + 2):
+            end = pattern.find(']', idx + 2)
+            body = pattern[idx + 1:end]
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            body = body.replace('\\', '\\\\').replace('[', '\\[')
+            rval.append('[' + body + ']')
+            idx = end
+        else:
+            rval.append(re.escape(char))
+        idx += 1
+    return ''.join(rval)
+
+
+# -----------------------------------------------------------------------------
+class ContentCache(object):
+    """
+    A cache of file contents for contents(..., cache=...). Each file is
+    cached under its absolute path and encoding along with its device,
+    inode, size, and mtime (in ns). When a stat() of the file no longer
+    matches, the entry is stale and the file is read again. Besides the
+    text, the split list for each separator asked for is kept, so a hit
+    costs one stat() and no reading or splitting.
+
+    The cache holds at most about *max_bytes* of data, counting each entry's
+    text and each of its split lists at the length of the text. Least
+    recently used entries are evicted to make room. The hits, misses, and
+    evictions attributes count what the cache has been doing.
+
+    ContentCache objects are thread safe.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Set up an empty cache holding at most *max_bytes*
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        The number of files in the cache
+        """
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Drop everything from the cache (the counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def contents(self, name, default=None, fmt='str', sep=None,
+                 encoding=None, errors=None):
+        """
+        Return what tbx.contents(name, default, fmt, sep, encoding=encoding,
+        errors=errors) would, from the cache if possible. Lists are returned
+        as copies so callers can't change what is cached.
+        """
+        if fmt not in ('str', str, 'list', list):
+            raise Error('Invalid format')
+        aslist = fmt in ('list', list)
+        if sep and not aslist:
+            raise Error('Non-default separator is only valid for list format')
+        skey = _sepkey(sep) if aslist else None
+        path = osp.abspath(name)
+        ckey = (path, encoding, errors)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            with self._lock:
+                entry = self._lookup(ckey, _stat_key(stat))
+                if entry is not None:
+                    self.hits += 1
+                    if not aslist:
+                        return entry['text']
+                    if skey not in entry['splits']:
+                        self._add_split(ckey, entry, skey)
+                    return list(entry['splits'][skey])
+
+        rbl = _open(name, 'r', default, encoding=encoding, errors=errors)
+        if rbl is None:
+            return _separator(skey)[1](default) if aslist else default
+        with rbl:
+            key = _stat_key(os.fstat(rbl.fileno()))
+            text = rbl.read()
+        with self._lock:
+            self.misses += 1
+            entry = {'key': key, 'text': text, 'splits': {}, 'size': 0}
+            self._store(ckey, entry, len(text))
+            if not aslist:
+                return text
+            self._add_split(ckey, entry, skey)
+            return list(entry['splits'][skey])
+
+    def _add_split(self, ckey, entry, skey):
+        """
+        Split *entry*'s text on *skey* and keep the result with the entry
+        """
+        entry['splits'][skey] = _separator(skey)[1](entry['text'])
+        if self._entries.get(ckey) is entry:
+            self._store(ckey, entry, len(entry['text']))
+
+    def _lookup(self, ckey, key):
+        """
+        Return the entry for *ckey* (path, encoding, errors) if it matches
+        stat *key*, marking it most recently used. A stale entry is dropped.
+        """
+        entry = self._entries.get(ckey)
+        if entry is None:
+            return None
+        if entry['key'] != key:
+            del self._entries[ckey]
+            self.size -= entry['size']
+            return None
+        self._entries.move_to_end(ckey)
+        return entry
+
+    def _store(self, ckey, entry, nbytes):
+        """
+        Grow *entry*, stored under *ckey*, by *nbytes* and evict least
+        recently used entries until the cache fits in max_bytes. An entry
+        too big for the cache on its own is not kept.
+        """
+        old = self._entries.pop(ckey, None)
+        if old is not None:
+            self.size -= old['size']
+        entry['size'] += nbytes
+        if self.max_bytes < entry['size']:
+            return
+        self._entries[ckey] = entry
+        self.size += entry['size']
+        while self.max_bytes < self.size:
+            (_, victim) = self._entries.popitem(last=False)
+            self.size -= victim['size']
+            self.evictions += 1
+
+
+_CONTENT_CACHE = ContentCache()
+
+
 # -----------------------------------------------------------------------------
 class Error(Exception):
     """
     Errors raised in this file
     """
     pass
+
+
+# -----------------------------------------------------------------------------
+class GlobCache(object):
+    """
+    A cache of directory listings for iglob_many(..., cache=...) and
+    lglob(..., cache=...). Each listing is kept under the absolute path of
+    its directory along with the directory's device, inode, and mtime (in
+    ns). Adding, removing, or renaming an entry changes the mtime, so when a
+    stat() of the directory no longer matches, the listing is stale and the
+    directory is listed again. A hit costs one stat() and no listing.
+
+    A directory changed within the last *settle* seconds isn't cached, since
+    another change in the same clock tick would leave its mtime the same.
+    The file types in the listing are cached with it, but other stat()
+    information (size, times) isn't, since changing a file doesn't change
+    its directory.
+
+    The cache holds listings with at most *max_entries* entries between them.
+    Least recently used listings are evicted to make room. invalidate()
+    drops listings that are known to be out of date. The hits, misses, and
+    evictions attributes count what the cache has been doing.
+
+    GlobCache objects are thread safe.
+    """
+    def __init__(self, max_entries=1000000, settle=0.1):
+        """
+        Set up an empty cache holding at most *max_entries* directory entries
+        """
+        self.max_entries = max_entries
+        self.settle = settle
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._listings = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        The number of directories in the cache
+        """
+        return len(self._listings)
+
+    def clear(self):
+        """
+        Drop everything from the cache (the counters are kept)
+        """
+        with self._lock:
+            self._listings.clear()
+            self.size = 0
+
+    def invalidate(self, path):
+        """
+        Drop the listings of directory *path* and the directories below it
+        """
+        path = osp.abspath(path)
+        below = osp.join(path, '')
+        with self._lock:
+            for key in [_ for _ in self._listings
+                        if _ == path or _.startswith(below)]:
+                self.size -= len(self._listings.pop(key)[1])
+
+    def listing(self, dirpath):
+        """
+        Return the os.DirEntry objects in directory *dirpath* ('' for the
+        current directory), or [] if it can't be listed
+        """
+        path = osp.abspath(dirpath or os.curdir)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._listings.get(path)
+            if cached is not None and cached[0] == key:
+                self._listings.move_to_end(path)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        entries = _glob_list(dirpath)
+        if time.time() - stat.st_mtime < self.settle or \
+           self.max_entries < len(entries):
+            return entries
+        with self._lock:
+            old = self._listings.pop(path, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._listings[path] = (key, entries)
+            self.size += len(entries)
+            while self.max_entries < self.size:
+                (_, victim) = self._listings.popitem(last=False)
+                self.size -= len(victim[1])
+                self.evictions += 1
+        return entries
+
+
+_GLOB_CACHE = GlobCache()
+
+
+# -----------------------------------------------------------------------------
+class _GlobEntry(object):
+    """
+    A stand-in for os.DirEntry for iglob_many() filters, for paths that
+    weren't found by listing a directory or whose listing came from a
+    GlobCache. Type information comes from *entry*, the DirEntry, if there
+    is one. stat() results are fetched on first use and kept.
+    """
+    def __init__(self, path, entry=None):
+        """
+        Describe *path*, using DirEntry *entry* for its type if it is given
+        """
+        self.path = path
+        self.name = osp.basename(path)
+        self._entry = entry
+        self._stat = {}
+
+    def inode(self):
+        """
+        The inode number of the path
+        """
+        return self.stat(follow_symlinks=False).st_ino
+
+    def is_dir(self, follow_symlinks=True):
+        """
+        True if the path is a directory (or, if *follow_symlinks*, a
+        symbolic link to one)
+        """
+        if self._entry is not None:
+            return self._entry.is_dir(follow_symlinks=follow_symlinks)
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        """
+        True if the path is a regular file (or, if *follow_symlinks*, a
+        symbolic link to one)
+        """
+        if self._entry is not None:
+            return self._entry.is_file(follow_symlinks=follow_symlinks)
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_symlink(self):
+        """
+        True if the path is a symbolic link
+        """
+        if self._entry is not None:
+            return self._entry.is_symlink()
+        return osp.islink(self.path)
+
+    def stat(self, follow_symlinks=True):
+        """
+        os.stat() (or, unless *follow_symlinks*, os.lstat()) of the path
+        """
+        if follow_symlinks not in self._stat:
+            self._stat[follow_symlinks] = os.stat(
+                self.path, follow_symlinks=follow_symlinks)
+        return self._stat[follow_symlinks]
+
+
+# -----------------------------------------------------------------------------
+class MissingDoc(collections.namedtuple('MissingDoc',
+                                        'module qualname lineno kind')):
+    """
+    A definition with no doc string, as reported by
+    collect_missing_docs(..., detail=True): the *module* it is in, its
+    *qualname* within the module ('Class', 'Class.method', or 'function'),
+    the *lineno* where it starts (None if that isn't known), and its *kind*,
+    'class', 'method', or 'function'.
+    """
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """
+        The name collect_missing_docs() reports without detail: classes and
+        methods by qualname, functions qualified by their module
+        """
+        if self.kind == 'function':
+            return "{}.{}".format(self.module, self.qualname)
+        return self.qualname
+
+
+# -----------------------------------------------------------------------------
+class RunResult(object):
+    """
+    The outcome of running a command with run(..., result=True) or with
+    run_many(). Attributes:
+
+        cmd         the command that was run
+        stdout      its output, as run() would return it (None if redirected)
+        stderr      its error output (all stages of a pipeline together)
+        returncode  its exit code (that of the last stage of a pipeline)
+        pid         its process id (that of the last stage of a pipeline)
+        spawn       seconds spent starting the process(es)
+        wall        seconds from start to exit, including spawn
+        utime       CPU seconds in user mode (summed over pipeline stages)
+        stime       CPU seconds in system mode (summed over pipeline stages)
+    """
+    __slots__ = ('cmd', 'stdout', 'stderr', 'returncode', 'pid', 'spawn',
+                 'wall', 'utime', 'stime')
+
+    def __init__(self, cmd, stdout=None, stderr=None, returncode=None,
+                 pid=None, spawn=None, wall=None, utime=None, stime=None):
+        """
+        Record the outcome of running *cmd*
+        """
+        self.cmd = cmd
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.pid = pid
+        self.spawn = spawn
+        self.wall = wall
+        self.utime = utime
+        self.stime = stime
+
+    def __repr__(self):
+        """
+        Show the command and its exit code
+        """
+        return "RunResult(cmd={!r}, returncode={!r})".format(self.cmd,
+                                                             self.returncode)
+
+    @property
+    def cpu(self):
+        """
+        Total CPU seconds (user + system) used by the command, or None if
+        that was not measured
+        """
+        if self.utime is None or self.stime is None:
+            return None
+        return self.utime + self.stime
+
+
+# -----------------------------------------------------------------------------
+class Shell(object):
+    """
+    A long-lived shell coprocess that runs commands one after another, so
+    running thousands of small commands doesn't pay for starting a process
+    from Python each time. Use it as a context manager:
+
+        with tbx.Shell() as sh:
+            for path in paths:
+                digest = sh.run("git hash-object {}".format(path))
+
+    Shell.run() has the same call shape as run(). Unlike run(), a string
+    command is parsed by the shell, so globs, $VARS, ';', '&&', etc. are
+    interpreted. Each command runs in a subshell, so 'exit', 'cd', or a
+    syntax error only affects that command. The output of each command is
+    framed by a random sentinel followed by its exit status. Commands must
+    not leave background jobs writing to stdout or stderr.
+    """
+    def __init__(self, shell='/bin/sh'):
+        """
+        Start *shell*
+        """
+        self.shell = shell
+        self._token = "TBX-{}".format(uuid.uuid4().hex)
+        self._lock = threading.Lock()
+        self._child = sproc.Popen([shell], stdin=sproc.PIPE,
+                                  stdout=sproc.PIPE, stderr=sproc.PIPE)
+
+    def __enter__(self):
+        """
+        Use the shell in a with statement
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        Shut down the shell at the end of the with statement
+        """
+        self.close()
+
+    @property
+    def pid(self):
+        """
+        The process id of the shell
+        """
+        return self._child.pid
+
+    def close(self):
+        """
+        Ask the shell to exit by closing its stdin and reap it, killing it if
+        it doesn't exit promptly
+        """
+        with self._lock:
+            child = self._child
+            if child.poll() is None:
+                with contextlib.suppress(BrokenPipeError):
+                    child.stdin.close()
+                try:
+                    child.wait(timeout=5)
+                except sproc.TimeoutExpired:
+                    child.kill()
+                    child.wait()
+            for pipe in (child.stdin, child.stdout, child.stderr):
+                pipe.close()
+
+    def run(self, cmd, input=None, output=None, result=False):
+        """
+        Run *cmd* in the shell. Return stdout + stderr, or, if *result* is
+        True, a RunResult with stdout and stderr kept apart and the exit
+        code. The pid and CPU times are not measured here and are None.
+
+        *cmd* is a string of shell syntax or a list of arguments, which are
+        quoted for the shell. *input* and *output* accept the same forms as
+        they do for run(). A file descriptor or file object given as *input*
+        is read here and handed to the command, and output destined for one
+        is collected and then written to it.
+        """
+        if isinstance(output, str) and output.strip()[:1] not in ('>', '|'):
+            raise Error('| or > required for string output')
+        with self._lock:
+            if self._child.poll() is not None:
+                raise Error("Shell {} is not running".format(self.shell))
+            start = time.monotonic()
+            tmpname = None
+            try:
+                (script, tmpname) = self._script(cmd, input, output, result)
+                try:
+                    self._child.stdin.write(script.encode())
+                    self._child.stdin.flush()
+                except BrokenPipeError:
+                    raise Error("Shell {} exited".format(self.shell))
+                (out, err, status) = self._collect()
+            finally:
+                if tmpname:
+                    os.unlink(tmpname)
+            wall = time.monotonic() - start
+
+        out = out.decode()
+        if isinstance(output, str):
+            out = out if output.strip().startswith('|') else None
+        elif isinstance(output, io.StringIO):
+            output.write(out)
+            out = None
+        elif isinstance(output, file):
+            output.write(out)
+            out = None
+        elif isinstance(output, int):
+            os.write(output, out.encode())
+            out = None
+        if not result:
+            return out
+        return RunResult(cmd, stdout=out, stderr=err.decode(),
+                         returncode=status, wall=wall)
+
+    def _collect(self):
+        """
+        Read the shell's stdout and stderr until the sentinel shows up on
+        both. Returns (out, err, status) with the framing removed.
+        """
+        marker = b'\n' + self._token.encode() + b' '
+        bufs = {self._child.stdout.fileno(): bytearray(),
+                self._child.stderr.fileno(): bytearray()}
+        frames = {}
+        with selectors.DefaultSelector() as sel:
+            for fd in bufs:
+                sel.register(fd, selectors.EVENT_READ)
+            while len(frames) < len(bufs):
+                for (key, _) in sel.select():
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        raise Error("Shell {} exited".format(self.shell))
+                    buf = bufs[key.fd]
+                    # only the tail can hold a marker we have not seen yet
+                    begin = max(0, len(buf) - len(marker) - 32)
+                    buf += chunk
+                    idx = buf.find(marker, begin)
+                    if idx < 0:
+                        continue
+                    end = buf.find(b'\n', idx + len(marker))
+                    if end < 0:
+                        continue
+                    frames[key.fd] = (bytes(buf[:idx]),
+                                      int(buf[idx + len(marker):end]))
+                    sel.unregister(key.fd)
+        (out, status) = frames[self._child.stdout.fileno()]
+        (err, _) = frames[self._child.stderr.fileno()]
+        return (out, err, status)
+
+    def _script(self, cmd, input, output, split):
+        """
+        Build the shell text that runs *cmd* with *input* and *output* and
+        then writes the sentinel and exit status to stdout and stderr.
+        Returns (script, tmpname) where tmpname is a temporary file holding
+        the input data, which the caller must remove, or None. Input that
+        run() would ignore (a binary file object, say) reads as empty, from
+        /dev/null.
+        """
+        if isinstance(cmd, (list, tuple)):
+            cmd = " ".join(shlex.quote(str(_)) for _ in cmd)
+        (cmds, input, output) = _stages([cmd], input, output)
+
+        tmpname = None
+        stdin = "/dev/null"
+        if isinstance(input, str) and input.strip().startswith('<'):
+            stdin = input.strip()[1:].strip()
+        elif input is not None:
+            if isinstance(input, int):
+                with os.fdopen(os.dup(input), 'rb') as rbl:
+                    data = rbl.read()
+            elif isinstance(input, file):
+                data = bytes(input.read(), 'utf8')
+            else:
+                (_, data) = _run_input(input, [])
+            if data is not None:
+                (fd, tmpname) = tempfile.mkstemp(prefix='tbx-shell-')
+                with os.fdopen(fd, 'wb') as wbl:
+                    wbl.write(data)
+                stdin = tmpname
+
+        stages = []
+        for idx, text in enumerate(cmds):
+            stage = "( eval {} )".format(shlex.quote(text))
+            if idx == 0:
+                stage += " <{}".format(shlex.quote(stdin))
+            if idx == len(cmds) - 1 and isinstance(output, str):
+                stage += " >{}".format(shlex.quote(output.strip()[1:].strip()))
+            if not split:
+                stage += " 2>&1"
+            stages.append(stage)
+        script = ("{0}\n"
+                  "printf '\\n%s %d\\n' {1} \"$?\"\n"
+                  "printf '\\n%s %d\\n' {1} 0 >&2\n"
+                  "".format(" | ".join(stages), self._token))
+        return (script, tmpname)
@@ -4,8 +4,11 @@ Tests for module tbx
 This is free and unencumbered software released into the public domain.
 For more information, please refer to <http://unlicense.org/>
 """
+import asyncio
 import glob
+import importlib
 import io
+import itertools
 import os
 import py
 import pytest
@@ -15,6 +18,7 @@ import shutil
 import subprocess as subp
 import sys
 import tbx
+import time
 
 
 # -----------------------------------------------------------------------------
@@ -40,6 +44,79 @@ def test_abspath(tmpdir):
         assert tbx.abspath("./testfile") == nib.strpath
 
 
+# -----------------------------------------------------------------------------
+def test_arun_cmd(rdata):
+    """
+    tbx.arun(cmd) should run the command and return its stdout + stderr
+    """
+    pytest.dbgfunc()
+    result = asyncio.run(tbx.arun("python -c 'import this'"))
+    assert isinstance(result, str)
+    assert result == tbx.run("python -c 'import this'")
+    for item in rdata.exp:
+        assert item in result
+
+
+# -----------------------------------------------------------------------------
+def test_arun_redirect(tmpdir):
+    """
+    tbx.arun() should accept the same input and output forms as tbx.run()
+    """
+    pytest.dbgfunc()
+    outfile = tmpdir.join('outfile')
+    outstr = io.StringIO()
+    result = asyncio.run(tbx.arun("head -n 2", input="yes |",
+                                  output="| tr y Y"))
+    assert result == "Y\nY\n"
+    assert asyncio.run(tbx.arun("cat", input="fed\n")) == "fed\n"
+    assert asyncio.run(tbx.arun("cat", input=io.StringIO("sio"),
+                                output=outstr)) is None
+    assert outstr.getvalue() != ""
+    asyncio.run(tbx.arun("echo hello",
+                         output="> {}".format(outfile.strpath)))
+    assert outfile.read() == "hello\n"
+    result = asyncio.run(tbx.arun("cat",
+                                  input="< {}".format(outfile.strpath)))
+    assert result == "hello\n"
+
+
+# -----------------------------------------------------------------------------
+def test_arun_timeout(tmpdir):
+    """
+    When the timeout expires, tbx.arun() should kill and reap the child and
+    raise asyncio.TimeoutError
+    """
+    pytest.dbgfunc()
+    pidfile = tmpdir.join('pid')
+    cmd = "sh -c 'echo $$ > {}; exec sleep 10'".format(pidfile.strpath)
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(tbx.arun(cmd, timeout=0.5))
+    assert time.monotonic() - start < 5
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pidfile.read()), 0)
+
+
+# -----------------------------------------------------------------------------
+def test_arun_concurrent():
+    """
+    Many tbx.arun() calls can be in flight at once on one event loop
+    """
+    pytest.dbgfunc()
+
+    async def batch():
+        """
+        Start 50 slow commands together
+        """
+        cmds = ["sh -c 'sleep 0.5; echo {}'".format(_) for _ in range(50)]
+        return await asyncio.gather(*[tbx.arun(_) for _ in cmds])
+
+    start = time.monotonic()
+    result = asyncio.run(batch())
+    assert time.monotonic() - start < 5
+    assert result == ["{}\n".format(_) for _ in range(50)]
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("arg, kw, exp", [
     pytest.param(("/a/b/c/d", ), {}, "d", id="normal absolute path"),
@@ -237,6 +314,421 @@ def test_contents_good_seplist(ctest):
     assert result == exp
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sep", [
+    pytest.param(None, id="default"),
+    pytest.param(r"\s", id="regex"),
+    pytest.param(["the", "is"], id="list"),
+    pytest.param(r"(i)s", id="group"),
+])
+def test_contents_lazy(ctest, sep):
+    """
+    contents(lazy=True) yields the same records as the list format
+    """
+    pytest.dbgfunc()
+    exp = tbx.contents(ctest.data.strpath, fmt='list', sep=sep)
+    result = tbx.contents(ctest.data.strpath, fmt='list', sep=sep, lazy=True)
+    assert not isinstance(result, list)
+    assert list(result) == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7, 64])
+def test_contents_lazy_boundary(chunk):
+    """
+    Separators that straddle a chunk boundary are still recognized
+    """
+    pytest.dbgfunc()
+    data = "one\r\ntwo\r\n\r\nthree ab abbbbbc x abc\r\n"
+    for rsep in [r"\r\n", r"ab+c", r"(\r\n)+"]:
+        regex = re.compile(rsep)
+        result = list(tbx._records(io.StringIO(data), regex, chunk=chunk,
+                                   slack=8))
+        assert result == regex.split(data)
+
+
+# -----------------------------------------------------------------------------
+def test_contents_lazy_large(tmpdir):
+    """
+    contents(lazy=True) on a file bigger than one chunk, with the file
+    closed once the iterator is done
+    """
+    pytest.dbgfunc()
+    bigfile = tmpdir.join('big')
+    lines = ["line {} ".format(_) * (_ % 17) for _ in range(20000)]
+    bigfile.write("\n".join(lines))
+    result = tbx.contents(bigfile.strpath, fmt='list', lazy=True)
+    assert next(result) == ""
+    assert list(result) == lines[1:]
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(bigfile.strpath, lazy=True)
+    assert 'lazy is only valid for list format' in str(err.value)
+    nosuch = tmpdir.join('nosuch').strpath
+    assert list(tbx.contents(nosuch, default="a\nb", fmt='list',
+                             lazy=True)) == ["a", "b"]
+
+
+# -----------------------------------------------------------------------------
+def test_contents_mmap(ctest, tmpdir):
+    """
+    contents(fmt='mmap') maps the file read-only
+    """
+    pytest.dbgfunc()
+    result = tbx.contents(ctest.data.strpath, fmt='mmap')
+    assert result[:] == ctest.exp.encode()
+    assert result.find(b'frumple') == ctest.exp.index('frumple')
+    exp = re.findall(rb'th\w+', ctest.exp.encode())
+    assert re.findall(rb'th\w+', result) == exp
+    with pytest.raises(TypeError):
+        result[0:4] = b'THIS'
+    result.close()
+    empty = tmpdir.join('empty')
+    empty.write('')
+    assert tbx.contents(empty.strpath, fmt='mmap') == b''
+    nosuch = tmpdir.join('nosuch').strpath
+    assert tbx.contents(nosuch, fmt='mmap', default=b'dflt') == b'dflt'
+
+
+# -----------------------------------------------------------------------------
+def test_contents_bytes(ctest, tmpdir):
+    """
+    contents(fmt='bytes') returns the file undecoded
+    """
+    pytest.dbgfunc()
+    assert tbx.contents(ctest.data.strpath, fmt='bytes') == ctest.exp.encode()
+    assert tbx.contents(ctest.data.strpath, fmt=bytes) == ctest.exp.encode()
+    binfile = tmpdir.join('binfile')
+    binfile.write_binary(bytes(range(256)))
+    assert tbx.contents(binfile.strpath, fmt='bytes') == bytes(range(256))
+    nosuch = tmpdir.join('nosuch').strpath
+    assert tbx.contents(nosuch, fmt='bytes', default=b'dflt') == b'dflt'
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(binfile.strpath, fmt='bytes', encoding='utf-8')
+    assert 'encoding is only valid for str and list' in str(err.value)
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(binfile.strpath, fmt='bytes', cache=True)
+    assert 'cache is only valid for str and list' in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_contents_encoding(tmpdir):
+    """
+    contents() decodes with the *encoding* and *errors* it is given, and a
+    cache keeps differently decoded texts apart
+    """
+    pytest.dbgfunc()
+    text = "caf\u00e9\nna\u00efve\n"
+    latin = tmpdir.join('latin')
+    latin.write_binary(text.encode('latin-1'))
+    assert tbx.contents(latin.strpath, encoding='latin-1') == text
+    assert tbx.contents(latin.strpath, fmt='list',
+                        encoding='latin-1') == text.split("\n")
+    with pytest.raises(UnicodeDecodeError):
+        tbx.contents(latin.strpath, encoding='utf-8')
+    exp = text.replace("\u00e9", "\ufffd").replace("\u00ef", "\ufffd")
+    assert tbx.contents(latin.strpath, encoding='utf-8',
+                        errors='replace') == exp
+    cache = tbx.ContentCache()
+    assert cache.contents(latin.strpath, encoding='latin-1') == text
+    assert cache.contents(latin.strpath, encoding='utf-8',
+                          errors='replace') != text
+    assert cache.contents(latin.strpath, encoding='latin-1') == text
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+# -----------------------------------------------------------------------------
+def test_contents_into(tmpdir):
+    """
+    contents(fmt='bytes', into=buf) reads the file into *buf* and returns the
+    number of bytes read
+    """
+    pytest.dbgfunc()
+    data = bytes(range(256)) * 40
+    binfile = tmpdir.join('binfile')
+    binfile.write_binary(data)
+    buf = bytearray(len(data) + 100)
+    assert tbx.contents(binfile.strpath, fmt='bytes', into=buf) == len(data)
+    assert buf[:len(data)] == data
+    assert buf[len(data):] == bytearray(100)
+    small = bytearray(1000)
+    assert tbx.contents(binfile.strpath, fmt=bytes, into=small) == 1000
+    assert small == data[:1000]
+    view = memoryview(bytearray(len(data)))
+    assert tbx.contents(binfile.strpath, fmt='bytes', into=view[:10]) == 10
+    assert view[:10] == data[:10]
+    nosuch = tmpdir.join('nosuch').strpath
+    assert tbx.contents(nosuch, fmt='bytes', into=buf, default=-1) == -1
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(binfile.strpath, into=buf)
+    assert 'into is only valid for bytes format' in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("text", [
+    pytest.param("", id="empty"),
+    pytest.param("one line", id="unterminated"),
+    pytest.param("one\ntwo\nthree\n", id="terminated"),
+    pytest.param("one\n\ntwo\n\n", id="empty-records"),
+    pytest.param("".join("line {}\n".format(_) for _ in range(5000)),
+                 id="many"),
+])
+@pytest.mark.parametrize("count", [0, 1, 2, 3, 4, 100, 4999, 6000])
+def test_contents_head_tail(tmpdir, text, count):
+    """
+    contents(head=N) and contents(tail=N) give the first or last N lines,
+    the way head(1) and tail(1) count them
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('lines')
+    path.write_binary(text.encode())
+    lines = text.splitlines(True)
+    exp_tail = lines[-count:] if count else []
+    assert tbx.contents(path.strpath, head=count) == "".join(lines[:count])
+    assert tbx.contents(path.strpath, tail=count) == "".join(exp_tail)
+    assert tbx.contents(path.strpath, fmt='list',
+                        head=count) == [_.rstrip("\n")
+                                        for _ in lines[:count]]
+    assert tbx.contents(path.strpath, fmt='list',
+                        tail=count) == [_.rstrip("\n") for _ in exp_tail]
+    assert tbx.contents(path.strpath, fmt='bytes',
+                        tail=count) == "".join(exp_tail).encode()
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("block", [1, 3, 7, 64])
+def test_contents_head_tail_blocks(block):
+    """
+    Reading by head or tail in small blocks doesn't break records, even for
+    a separator whose matches grow as more data is read
+    """
+    pytest.dbgfunc()
+    data = b"a\r\n\r\nbb\r\ncc\r\n\r\n\r\nddd\r\n"
+    regex = re.compile(rb"(?:\r\n)+")
+    for count in range(6):
+        records = regex.split(data)[:-1]
+        rbl = io.BytesIO(data)
+        head = tbx._head(rbl, regex, count, block=block, slack=8)
+        assert regex.split(head)[:-1] == records[:count]
+        tail = tbx._tail(rbl, regex, count, block=block, slack=8)
+        exp = records[-count:] if count else []
+        assert regex.split(tail)[:-1] == exp
+
+
+# -----------------------------------------------------------------------------
+def test_contents_head_tail_sep(tmpdir):
+    """
+    head and tail count records by the list separator
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('recs')
+    path.write("a, b,c ,  d,e")
+    assert tbx.contents(path.strpath, fmt='list', sep=r",\s*",
+                        head=2) == ["a", "b"]
+    assert tbx.contents(path.strpath, fmt='list', sep=r",\s*",
+                        tail=3) == ["c ", "d", "e"]
+    assert tbx.contents(path.strpath, fmt='list', sep=[",", " "],
+                        tail=2) == ["d", "e"]
+
+    path.write_binary(b"a\r\nb\r\nc\r\n")
+    assert tbx.contents(path.strpath, fmt='list', sep=r"\r\n",
+                        head=2) == ["a", "b"]
+    assert tbx.contents(path.strpath, fmt='list', sep=r"\r\n",
+                        tail=1) == ["c"]
+    assert tbx.contents(path.strpath, head=1) == "a\r\n"
+
+
+# -----------------------------------------------------------------------------
+def test_contents_range(tmpdir):
+    """
+    contents(offset=..., length=...) reads a range of bytes
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('range')
+    data = "".join("line {}\n".format(_) for _ in range(1000))
+    path.write(data)
+    assert tbx.contents(path.strpath, offset=7, length=14) == data[7:21]
+    assert tbx.contents(path.strpath, offset=-14) == data[-14:]
+    assert tbx.contents(path.strpath, length=14) == data[:14]
+    assert tbx.contents(path.strpath, offset=len(data) + 5) == ""
+    assert tbx.contents(path.strpath, offset=-len(data) - 5) == data
+    assert tbx.contents(path.strpath, offset=-len(data) - 5,
+                        length=4) == data[:4]
+    assert tbx.contents(path.strpath, fmt='list', offset=7,
+                        length=14) == data[7:21].split("\n")
+    assert tbx.contents(path.strpath, fmt='bytes', offset=-3) == b"99\n"
+    buf = bytearray(10)
+    assert tbx.contents(path.strpath, fmt='bytes', into=buf, offset=7,
+                        length=5) == 5
+    assert buf == data[7:12].encode() + bytes(5)
+    nosuch = tmpdir.join('nosuch').strpath
+    assert tbx.contents(nosuch, default="dflt", tail=5) == "dflt"
+    assert tbx.contents(nosuch, default="x\ny", fmt='list',
+                        tail=1) == ["y"]
+    assert tbx.contents(nosuch, default="x\ny", head=1) == "x\n"
+    assert tbx.contents(nosuch, default="x\ny", offset=-1) == "y"
+    assert tbx.contents(nosuch, default=b"abc", fmt='bytes',
+                        offset=1) == b"bc"
+    assert tbx.contents(nosuch, default=-1, fmt='bytes', into=buf,
+                        length=2) == -1
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("kwa, msg", [
+    pytest.param({'head': 1, 'lazy': True, 'fmt': 'list'},
+                 "only valid for str, list, and bytes", id="lazy"),
+    pytest.param({'tail': 1, 'cache': True}, "only valid for str, list",
+                 id="cache"),
+    pytest.param({'offset': 1, 'fmt': 'mmap'}, "only valid for str, list",
+                 id="mmap"),
+    pytest.param({'head': 1, 'tail': 1}, "mutually exclusive", id="both"),
+    pytest.param({'tail': 1, 'length': 1}, "mutually exclusive",
+                 id="tail-length"),
+    pytest.param({'tail': 1, 'fmt': 'bytes', 'into': bytearray(5)},
+                 "into is not valid", id="into"),
+    pytest.param({'head': 1, 'sep': ','}, "Non-default separator",
+                 id="sep"),
+    pytest.param({'head': 1, 'fmt': 'foo'}, "Invalid format", id="fmt"),
+])
+def test_contents_range_errors(ctest, kwa, msg):
+    """
+    Invalid combinations of range arguments
+    """
+    pytest.dbgfunc()
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(ctest.data.strpath, **kwa)
+    assert msg in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sep, literal", [
+    pytest.param("\n", "\n", id="newline"),
+    pytest.param(r"\n", "\n", id="escaped-newline"),
+    pytest.param(", ", ", ", id="comma-space"),
+    pytest.param(r"\.", ".", id="escaped-dot"),
+    pytest.param(r"\\", "\\", id="backslash"),
+    pytest.param(".", None, id="dot"),
+    pytest.param(r"\s", None, id="class"),
+    pytest.param(r"a|b", None, id="alternation"),
+    pytest.param(r"(x)", None, id="group"),
+    pytest.param("\\", None, id="dangling-backslash"),
+])
+def test_contents_literal_sep(tmpdir, sep, literal):
+    """
+    Literal separators are recognized and split with str.split(); either
+    way, the result matches re.split()
+    """
+    pytest.dbgfunc()
+    text = "a, b.c\\d\ne x\nf, g.\n\nh a|b"
+    data = tmpdir.join('data')
+    data.write(text)
+    assert tbx._literal(sep) == literal
+    if sep == "\\":
+        with pytest.raises(re.error):
+            tbx.contents(data.strpath, fmt='list', sep=sep)
+        return
+    exp = re.split(sep, text)
+    assert tbx.contents(data.strpath, fmt='list', sep=sep) == exp
+    assert list(tbx.contents(data.strpath, fmt='list', sep=sep,
+                             lazy=True)) == exp
+
+
+# -----------------------------------------------------------------------------
+def test_contents_cache(ctest):
+    """
+    With a ContentCache, the second read of an unchanged file is a hit, for
+    the text and for each separator's list
+    """
+    pytest.dbgfunc()
+    cache = tbx.ContentCache()
+    name = ctest.data.strpath
+    assert tbx.contents(name, cache=cache) == ctest.exp
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert tbx.contents(name, cache=cache) == ctest.exp
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    exp = ctest.exp.split("\n")
+    result = tbx.contents(name, fmt='list', cache=cache)
+    assert result == exp
+    result.append("changed by caller")
+    assert tbx.contents(name, fmt='list', cache=cache) == exp
+    assert tbx.contents(name, fmt='list', sep=["the", "is"],
+                        cache=cache) == re.split("the|is", ctest.exp)
+    assert (cache.hits, cache.misses) == (4, 1)
+    assert len(cache) == 1
+    assert cache.size == 3 * len(ctest.exp)
+
+
+# -----------------------------------------------------------------------------
+def test_contents_cache_stale(ctest):
+    """
+    A change in the file's size or mtime makes the cached entry stale
+    """
+    pytest.dbgfunc()
+    cache = tbx.ContentCache()
+    name = ctest.data.strpath
+    tbx.contents(name, cache=cache)
+    ctest.data.write("different")
+    assert tbx.contents(name, cache=cache) == "different"
+    ctest.data.write("same size")
+    stat = os.stat(name)
+    os.utime(name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert tbx.contents(name, cache=cache) == "same size"
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert cache.size == len("same size")
+
+
+# -----------------------------------------------------------------------------
+def test_contents_cache_evict(tmpdir):
+    """
+    The cache evicts least recently used entries to stay within max_bytes
+    and doesn't keep an entry that is too big on its own
+    """
+    pytest.dbgfunc()
+    cache = tbx.ContentCache(max_bytes=100)
+    names = []
+    for fname in ["one", "two", "three"]:
+        names.append(tmpdir.join(fname))
+        names[-1].write(fname * (40 // len(fname)))
+        tbx.contents(names[-1].strpath, cache=cache)
+    assert (len(cache), cache.evictions) == (2, 1)
+    tbx.contents(names[1].strpath, cache=cache)
+    assert cache.hits == 1
+    tbx.contents(names[0].strpath, cache=cache)
+    assert (cache.misses, cache.evictions) == (4, 2)
+    tbx.contents(names[1].strpath, cache=cache)
+    assert cache.hits == 2
+
+    big = tmpdir.join("big")
+    big.write("x" * 101)
+    assert tbx.contents(big.strpath, cache=cache) == "x" * 101
+    assert len(cache) == 2
+    cache.clear()
+    assert (len(cache), cache.size) == (0, 0)
+
+
+# -----------------------------------------------------------------------------
+def test_contents_cache_misc(ctest, tmpdir):
+    """
+    cache=True uses a shared cache; missing files and invalid combinations
+    behave as they do without a cache
+    """
+    pytest.dbgfunc()
+    name = ctest.data.strpath
+    assert tbx.contents(name, cache=True) == ctest.exp
+    assert tbx.contents(name, cache=True) == ctest.exp
+    nosuch = tmpdir.join('nosuch').strpath
+    assert tbx.contents(nosuch, default="a\nb", fmt='list',
+                        cache=True) == ["a", "b"]
+    with pytest.raises(IOError):
+        tbx.contents(nosuch, cache=True)
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(name, fmt='mmap', cache=True)
+    assert 'cache is only valid for str and list formats' in str(err.value)
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents(name, sep=r'\s', cache=True)
+    assert 'Non-default separator is only valid' in str(err.value)
+
+
 # -----------------------------------------------------------------------------
 def test_contents_badfmt(ctest):
     """
@@ -272,6 +764,50 @@ def test_contents_invalid_fmt(ctest):
     assert "Invalid format" in str(err.value)
 
 
+# -----------------------------------------------------------------------------
+def test_contents_many(tmpdir):
+    """
+    contents_many() reads a batch of files concurrently, returning results
+    in order or as a dict
+    """
+    pytest.dbgfunc()
+    paths = []
+    for idx in range(50):
+        paths.append(tmpdir.join("file{}".format(idx)).strpath)
+        with open(paths[-1], 'w') as wbl:
+            wbl.write("file {}\nline two\n".format(idx))
+    exp = [tbx.contents(_) for _ in paths]
+    assert tbx.contents_many(paths, workers=8) == exp
+    result = tbx.contents_many(reversed(paths), fmt='list', as_dict=True)
+    assert result == {_: tbx.contents(_, fmt='list') for _ in paths}
+
+
+# -----------------------------------------------------------------------------
+def test_contents_many_errors(tmpdir):
+    """
+    A file that can't be read gets its default or its exception; the rest of
+    the batch is unaffected
+    """
+    pytest.dbgfunc()
+    good = tmpdir.join("good")
+    good.write("good stuff")
+    nosuch = tmpdir.join("nosuch").strpath
+    result = tbx.contents_many([nosuch, good.strpath])
+    assert isinstance(result[0], IOError)
+    assert "No such file or directory" in str(result[0])
+    assert result[1] == "good stuff"
+    result = tbx.contents_many([nosuch, good.strpath], default="dflt")
+    assert result == ["dflt", "good stuff"]
+    result = tbx.contents_many([tmpdir.strpath, good.strpath])
+    assert isinstance(result[0], IOError)
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents_many([good.strpath], fmt='bogus')
+    assert "Invalid format" in str(err.value)
+    with pytest.raises(tbx.Error) as err:
+        tbx.contents_many([good.strpath], sep=r'\s')
+    assert "Non-default separator is only valid" in str(err.value)
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("arg, kw, exp", [
     pytest.param(("/a/b/c/d/e", 0), {}, "/a/b/c/d/e", id="/a/b/c/d/e, s=0"),
@@ -528,6 +1064,132 @@ def test_fatal_number():
     assert str(msg) in str(err.value)
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("notify", [True, False])
+def test_follow(tmpdir, notify):
+    """
+    follow() generates records as they are appended, and keeps up when the
+    file is truncated or replaced
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('log')
+    path.write("old\n")
+    follower = tbx.follow(path.strpath, timeout=5, notify=notify)
+    path.write("new 1\nnew 2\npart", mode='a')
+    assert next(follower) == "new 1"
+    assert next(follower) == "new 2"
+    path.write("ial\n", mode='a')
+    assert next(follower) == "partial"
+
+    path.write("short\n")
+    assert next(follower) == "short"
+
+    path.rename(tmpdir.join('log.1'))
+    path.write("rotated\n")
+    assert next(follower) == "rotated"
+    tmpdir.join('log.1').remove()
+    path.write("rotated again\n", mode='a')
+    assert next(follower) == "rotated again"
+    follower.close()
+
+
+# -----------------------------------------------------------------------------
+def test_follow_large(tmpdir, monkeypatch):
+    """
+    follow(whole=True) on a file bigger than a chunk reads it a chunk at a
+    time and generates every record
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('big')
+    lines = ["line {} é".format(_) for _ in range(30000)]
+    path.write_binary("".join(_ + "\n" for _ in lines).encode())
+    assert 65536 * 3 < path.size()
+    sizes = []
+    real_open = tbx._follow_open
+
+    def spy_open(*args):
+        rbl = real_open(*args)
+        if rbl is None:
+            return rbl
+        real_read = rbl.read
+
+        def read(size=-1):
+            sizes.append(size)
+            return real_read(size)
+        return type('Spy', (), {'read': staticmethod(read),
+                                '__getattr__': lambda self, name:
+                                getattr(rbl, name)})()
+
+    monkeypatch.setattr(tbx, '_follow_open', spy_open)
+    result = list(tbx.follow(path.strpath, whole=True, timeout=0.2,
+                             notify=False, encoding='utf-8'))
+    assert result == lines
+    assert sizes and all(0 < _ <= 65536 for _ in sizes)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sep, writes, exp", [
+    pytest.param("\n", ["caf\\303", "\\251\\n"], ["caf\u00e9"], id="utf8"),
+    pytest.param(r",\s*", ["a,", " b,"], ["a", "b"], id="growing-sep"),
+])
+def test_follow_split_writes(tmpdir, sep, writes, exp):
+    """
+    follow() doesn't break a character or a separator that arrives in two
+    writes, and splits the way contents() does
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('log')
+    path.write("")
+    follower = tbx.follow(path.strpath, sep=sep, timeout=1, notify=False,
+                          interval=(0.01, 0.05), encoding='utf-8')
+    script = "; sleep 0.3; ".join("printf '{}' >> {}".format(_, path.strpath)
+                                  for _ in writes)
+    writer = subp.Popen(["sh", "-c", script])
+    result = list(follower)
+    writer.wait()
+    assert result == exp
+    assert tbx.contents(path.strpath, fmt='list', sep=sep,
+                        encoding='utf-8')[:-1] == exp
+
+
+# -----------------------------------------------------------------------------
+def test_follow_unstarted(tmpdir):
+    """
+    A follow() generator that is never started holds no file descriptors
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('log')
+    path.write("old\n")
+    before = len(os.listdir("/proc/self/fd"))
+    followers = [tbx.follow(path.strpath) for _ in range(20)]
+    assert len(os.listdir("/proc/self/fd")) == before
+    path.write("new\n", mode='a')
+    assert next(followers[0]) == "new"
+    followers[0].close()
+
+
+# -----------------------------------------------------------------------------
+def test_follow_whole(tmpdir):
+    """
+    follow(whole=True) starts at the beginning of the file, a file that
+    doesn't exist yet is waited for, and *timeout* ends the generator
+    """
+    pytest.dbgfunc()
+    path = tmpdir.join('log')
+    path.write("a, b,c, ")
+    start = time.time()
+    assert list(tbx.follow(path.strpath, sep=r",\s*", whole=True,
+                           timeout=0.2)) == ["a", "b", "c"]
+    assert 0.2 <= time.time() - start < 2
+
+    nosuch = tmpdir.join('nosuch')
+    follower = tbx.follow(nosuch.strpath, timeout=5, interval=(0.01, 0.05),
+                          notify=False)
+    nosuch.write("first\nsecond\n")
+    assert list(itertools.islice(follower, 2)) == ["first", "second"]
+    follower.close()
+
+
 # -----------------------------------------------------------------------------
 def test_git_current_branch():
     """
@@ -540,6 +1202,17 @@ def test_git_current_branch():
     assert marked in blist
 
 
+# -----------------------------------------------------------------------------
+def test_git_current_branch_norepo(tmpdir):
+    """
+    Outside a git repo, tbx.git_current_branch() should return '' rather than
+    git's error message
+    """
+    pytest.dbgfunc()
+    with tbx.chdir(tmpdir.strpath):
+        assert tbx.git_current_branch() == ""
+
+
 # -----------------------------------------------------------------------------
 def test_git_hash():
     """
@@ -590,6 +1263,177 @@ def test_git_status(tmpdir):
         assert untracked_l == ["untracked"]
 
 
+# -----------------------------------------------------------------------------
+def test_glob_cache(globtree):
+    """
+    A GlobCache serves listings of directories that haven't changed, and
+    lists changed or invalidated ones again
+    """
+    pytest.dbgfunc()
+    settle(globtree)
+    cache = tbx.GlobCache()
+    pattern = globtree.join("**", "*.py").strpath
+    exp = tbx.lglob(pattern, sort=True)
+    assert tbx.lglob(pattern, sort=True, cache=cache) == exp
+    (listed, size) = (cache.misses, cache.size)
+    assert (cache.hits, len(cache)) == (0, listed)
+    assert tbx.lglob(pattern, sort=True, cache=cache) == exp
+    assert (cache.hits, cache.misses, cache.size) == (listed, listed, size)
+
+    globtree.join("a", "b", "new.py").ensure()
+    exp = tbx.lglob(pattern, sort=True)
+    assert tbx.lglob(pattern, sort=True, cache=cache) == exp
+    assert (cache.hits, cache.misses) == (2 * listed - 1, listed + 1)
+    assert globtree.join("a", "b", "new.py").strpath in exp
+
+    cache.invalidate(globtree.join("a").strpath)
+    assert len(cache) == listed - 3
+    assert tbx.lglob(pattern, sort=True, cache=True) == exp
+    cache.clear()
+    assert (len(cache), cache.size) == (0, 0)
+
+
+# -----------------------------------------------------------------------------
+def test_glob_cache_evict(globtree):
+    """
+    A GlobCache evicts the least recently used listings to stay within
+    max_entries
+    """
+    pytest.dbgfunc()
+    settle(globtree)
+    cache = tbx.GlobCache(max_entries=5)
+    with tbx.chdir(globtree.strpath):
+        assert cache.listing('') is cache.listing('')
+        assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 0)
+        assert len(cache.listing('a')) == 3
+        assert (cache.evictions, len(cache), cache.size) == (1, 1, 3)
+        assert len(cache.listing('a/b')) == 4
+        assert (cache.evictions, len(cache), cache.size) == (2, 1, 4)
+        assert cache.listing('nosuch') == []
+
+
+# -----------------------------------------------------------------------------
+def test_iglob_many_exclude(globtree, monkeypatch):
+    """
+    iglob_many(exclude=...) drops the paths gitignore-style patterns match,
+    relative to each pattern's root the way walk() matches them, and doesn't
+    list excluded directories
+    """
+    pytest.dbgfunc()
+    listed = []
+    real_list = tbx._glob_list
+
+    def counting_list(dirpath):
+        listed.append(dirpath)
+        return real_list(dirpath)
+
+    monkeypatch.setattr(tbx, '_glob_list', counting_list)
+    with tbx.chdir(globtree.strpath):
+        assert sorted(tbx.iglob_many("**", exclude=["c/", "*.txt"])) == [
+            "a", "a/b", "a/b/g.py", "a/f.py", "t.py", "x", "x/y"]
+        assert "a/b/c" not in listed
+        assert tbx.lglob("a/b/c/*.py", exclude="c/") == ["a/b/c/h.py"]
+        assert tbx.lglob("a/**/*.py", exclude="/b/") == ["a/f.py"]
+        assert sorted(tbx.lglob("*/*/", exclude="/b/")) == ["a/b/", "x/y/"]
+        assert sorted(tbx.lglob("*/*/", exclude="/a/b/")) == ["x/y/"]
+
+    root = globtree.strpath
+    assert tbx.lglob(os.path.join(root, "a/**/*.py"),
+                     exclude="!*.py\n*.py\n!g.py") == [
+        os.path.join(root, "a/b/g.py")]
+    hidden = os.path.join(root, "a", ".h")
+    assert tbx.lglob(os.path.join(hidden, "**/*.py"), exclude=".*/") == [
+        os.path.join(hidden, _) for _ in tbx.walk(hidden, exclude=".*/")]
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("pattern", [
+    "*", "*.py", ".*", "*/", "*/*/", "**", "**/", "**/*.py", "**/.*",
+    "a/**", "a/**/", "a/**/*.py", "a/**/c", "**/c/**", "a/*/c/*",
+    "a/.*/c/*", "a/.h/**", "a/b/c/h.py", "a/b/../f.py", "nosuch", ".",
+    "./*.py",
+])
+@pytest.mark.parametrize("absolute", [False, True])
+def test_iglob_many_like_glob(globtree, pattern, absolute):
+    """
+    For one pattern, iglob_many() generates what glob.iglob() does
+    """
+    pytest.dbgfunc()
+    if absolute:
+        pattern = globtree.join(pattern).strpath
+    with tbx.chdir(globtree.strpath):
+        exp = sorted(glob.glob(pattern, recursive=True))
+        assert sorted(tbx.iglob_many(pattern)) == exp
+        exp = sorted(glob.glob(pattern))
+        assert sorted(tbx.iglob_many(pattern, recursive=False)) == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("pattern, single", [
+    pytest.param("**/**", "**", id="double"),
+    pytest.param("a/**/**/*.py", "a/**/*.py", id="double_mid"),
+    pytest.param("**/**/", "**/", id="double_dirs"),
+    pytest.param(".*/**/**", ".*/**", id="hidden"),
+])
+def test_iglob_many_once(globtree, pattern, single):
+    """
+    iglob_many() generates each match of a pattern once, even when several
+    of its '**' components could match it, but still once per pattern
+    """
+    pytest.dbgfunc()
+    globtree.join(".hid", "i.py").ensure()
+    with tbx.chdir(globtree.strpath):
+        exp = sorted(tbx.iglob_many(single))
+        assert len(exp) == len(set(exp))
+        assert sorted(tbx.iglob_many(pattern)) == exp
+        assert sorted(tbx.iglob_many(pattern, workers=2)) == exp
+        assert sorted(tbx.iglob_many(pattern, pattern)) == sorted(exp * 2)
+
+
+# -----------------------------------------------------------------------------
+def test_iglob_many_shared(globtree, monkeypatch):
+    """
+    iglob_many() lists each directory once for all the patterns, and looks
+    up literal components without listing
+    """
+    pytest.dbgfunc()
+    listed = []
+    real_list = tbx._glob_list
+
+    def counting_list(dirpath):
+        listed.append(dirpath)
+        return real_list(dirpath)
+
+    monkeypatch.setattr(tbx, '_glob_list', counting_list)
+    root = globtree.strpath
+    result = tbx.iglob_many(*[os.path.join(root, _)
+                              for _ in ["a/*/*.py", "a/b/*/*", "a/**/*.py",
+                                        "x/y/z.txt"]])
+    assert not listed
+    assert sorted(os.path.relpath(_, root) for _ in result) == [
+        "a/b/c/h.py", "a/b/c/h.py", "a/b/g.py", "a/b/g.py", "a/f.py",
+        "x/y/z.txt"]
+    assert sorted(listed) == sorted(set(listed))
+    assert root not in listed
+
+
+# -----------------------------------------------------------------------------
+def test_iglob_many_workers(globtree):
+    """
+    iglob_many(workers=N) finds the same paths as a serial walk, and can be
+    abandoned part way through
+    """
+    pytest.dbgfunc()
+    patterns = [globtree.join(_).strpath
+                for _ in ["**", "a/**/*.py", "*/*/", "x/y/z.txt", "a/.*/*"]]
+    exp = sorted(tbx.iglob_many(*patterns))
+    assert sorted(tbx.iglob_many(*patterns, workers=4)) == exp
+    assert sorted(tbx.lglob(*patterns, workers=4)) == sorted(set(exp))
+    walk = tbx.iglob_many(*patterns, workers=2)
+    assert next(walk) in exp
+    walk.close()
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("inp, exp", [
     pytest.param("17", True, id="001"),
@@ -639,36 +1483,422 @@ def test_lglob(flist, glist, dupl_allowed, exp, tmpdir):
 
 
 # -----------------------------------------------------------------------------
-def test_missing_doc():
+def test_lglob_order(globtree):
     """
-    This function has a doc string
+    lglob() keeps each path where it was first found, or sorts them
     """
     pytest.dbgfunc()
-    exp = ["test.test_tbx.xtst_undocumented"]
-    result = tbx.collect_missing_docs(".", ignore_l=["local"])
-    assert result == exp
+    with tbx.chdir(globtree.strpath):
+        patterns = ["a/**/*.py", "*/b/*", "*.py", "a/b/*.py"]
+        exp = []
+        for path in tbx.iglob_many(*patterns):
+            if path not in exp:
+                exp.append(path)
+        assert tbx.lglob(*patterns) == exp
+        assert tbx.lglob(*patterns, sort=True) == sorted(exp)
+        assert tbx.lglob(*patterns, sort=len) == sorted(exp, key=len)
+        assert tbx.lglob(*patterns, dupl_allowed=True,
+                         sort=True) == sorted(tbx.iglob_many(*patterns))
 
 
 # -----------------------------------------------------------------------------
-def test_missing_doc_td(tmpdir):
+def test_lglob_dedupe_by(tmpdir):
     """
-    Write some .py files in tmpdir and test on those
+    lglob(dedupe_by=...) collapses symbolic and hard links
     """
     pytest.dbgfunc()
-    tcontent = [
-        "def %_with_doc():",
-        "    \"\"\"",
-        "    This function has a docstring",
-        "    \"\"\"",
-        "    pass",
-        "",
-        "def %_no_doc():",
-        "    print(\"undocumented function\")", ]
-    fpath_l = {"testee/__init__.py": "ti",
-               "frippety/aardvark.py": "aard",
-               "frippety/__init__.py": "aard_init",
-               "venv/bogus.py": "bog",
-               ".foobar/fumple.py": "fump",
+    with tbx.chdir(tmpdir.strpath):
+        tmpdir.join("file").write("data")
+        tmpdir.join("other").write("data")
+        os.symlink("file", "sym")
+        os.link("file", "hard")
+        os.symlink("nosuch", "dangling")
+        assert tbx.lglob("*", sort=True) == ["dangling", "file", "hard",
+                                             "other", "sym"]
+        result = tbx.lglob("f*", "*", dedupe_by='realpath')
+        assert result[0] == "file"
+        assert sorted(result) == ["dangling", "file", "hard", "other"]
+        result = tbx.lglob("f*", "*", dedupe_by='inode')
+        assert result[0] == "file"
+        assert sorted(result) == ["dangling", "file", "other"]
+        with pytest.raises(tbx.Error) as err:
+            tbx.lglob("*", dedupe_by='bogus')
+        assert "Unknown dedupe_by 'bogus'" in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_lglob_filter(tmpdir):
+    """
+    lglob(filter=...) keeps only the paths that pass the filter
+    """
+    pytest.dbgfunc()
+    with tbx.chdir(tmpdir.strpath):
+        tmpdir.join("small").write("x")
+        tmpdir.join("big").write("x" * 1000)
+        tmpdir.join("sub").ensure(dir=True)
+        os.symlink("big", "link")
+        then = time.time() - 3600
+        os.utime("small", (then, then))
+        os.utime("sub", (then, then))
+        tmpdir.join("stamp").ensure()
+        os.utime("stamp", (then + 60, then + 60))
+
+        def check(spec, exp, cache=None):
+            assert tbx.lglob("*", sort=True, filter=spec, cache=cache) == exp
+            assert tbx.lglob("s*", "[!s]*", sort=True, filter=spec,
+                             cache=cache) == exp
+
+        check({'type': 'file'}, ["big", "small", "stamp"])
+        check({'type': 'dir'}, ["sub"])
+        check({'type': ['dir', 'link']}, ["link", "sub"])
+        check({'min_size': 10, 'type': ['file', 'link']}, ["big", "link"])
+        check({'max_size': 10, 'type': 'file'}, ["small", "stamp"])
+        check({'newer': then + 30}, ["big", "link", "stamp"])
+        check({'newer': "stamp"}, ["big", "link"])
+        check({'test': lambda entry: entry.name.endswith("ll")}, ["small"])
+        check(lambda entry: entry.is_symlink(), ["link"])
+        assert tbx.lglob("**/", filter={'type': 'dir'}) == ["sub/"]
+        assert tbx.lglob("**/", filter={'type': 'file'}) == []
+        assert tbx.lglob("sub", "big", "link", sort=True,
+                         filter={'type': ['dir', 'link']}) == ["link", "sub"]
+        settle(tmpdir)
+        cache = tbx.GlobCache()
+        big = {'min_size': 10, 'type': ['file', 'link']}
+        check(big, ["big", "link"], cache)
+        tmpdir.join("small").write("x" * 100)
+        check(big, ["big", "link", "small"], cache)
+        assert cache.hits
+
+        with pytest.raises(tbx.Error) as err:
+            tbx.lglob("*", filter={'size': 10})
+        assert "Unknown filter key(s): size" in str(err.value)
+        with pytest.raises(tbx.Error) as err:
+            tbx.lglob("*", filter={'type': 'fifo'})
+        assert "Unknown filter type(s): fifo" in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_lglob_filter_stats(tmpdir, monkeypatch):
+    """
+    A filter sees the os.DirEntry objects from the listing, so it doesn't
+    stat() the paths again
+    """
+    pytest.dbgfunc()
+    for idx in range(10):
+        tmpdir.join("file{}".format(idx)).write("x" * idx)
+    calls = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        if os.path.basename(str(path)).startswith("file"):
+            calls.append(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    entries = []
+
+    def test(entry):
+        entries.append(entry)
+        return entry.stat().st_size % 2
+
+    pattern = tmpdir.join("*").strpath
+    result = tbx.lglob(pattern, sort=True, filter={'min_size': 5,
+                                                   'max_size': 8,
+                                                   'type': 'file',
+                                                   'test': test})
+    assert [os.path.basename(_) for _ in result] == ["file5", "file7"]
+    assert calls == []
+    assert len(entries) == 4
+    assert all(isinstance(_, os.DirEntry) for _ in entries)
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc():
+    """
+    This function has a doc string
+    """
+    pytest.dbgfunc()
+    exp = ["test.test_tbx.xtst_undocumented"]
+    result = tbx.collect_missing_docs(".", ignore_l=["local"])
+    assert result == exp
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_cache(tmpdir):
+    """
+    collect_missing_docs(cache=...) rescans only the files that changed
+    """
+    pytest.dbgfunc()
+    tmpdir.join("one.py").write("def one():\n    pass\n")
+    tmpdir.join("two.py").write("def two():\n    'doc'\n")
+    cachefile = tmpdir.join(".tbx-doc-cache.jsonl")
+    with tbx.chdir(tmpdir.strpath):
+        stats = {}
+        assert tbx.collect_missing_docs(".", static=True, cache=True,
+                                        stats=stats) == ["one.one"]
+        assert stats == {'files': 2, 'hits': 0, 'scanned': 2}
+        assert len(cachefile.readlines()) == 2
+        assert tbx.collect_missing_docs(".", static=True, cache=True,
+                                        stats=stats) == ["one.one"]
+        assert stats == {'files': 2, 'hits': 2, 'scanned': 0}
+
+        tmpdir.join("two.py").write("def two():\n    pass\n")
+        then = time.time() - 3600
+        os.utime("one.py", (then, then))
+        assert sorted(tbx.collect_missing_docs(
+            ".", static=True, cache=True, stats=stats)) == ["one.one",
+                                                            "two.two"]
+        assert stats == {'files': 2, 'hits': 1, 'scanned': 1}
+        assert sorted(tbx.collect_missing_docs(
+            ".", static=True, ignore_l=["x"], cache=cachefile.strpath,
+            stats=stats)) == ["one.one", "two.two"]
+        assert stats == {'files': 2, 'hits': 0, 'scanned': 2}
+
+        tmpdir.join("two.py").remove()
+        cachefile.write("garbage\n", mode='a')
+        assert tbx.collect_missing_docs(".", static=True, ignore_l=["x"],
+                                        cache=True,
+                                        stats=stats) == ["one.one"]
+        assert stats == {'files': 1, 'hits': 1, 'scanned': 0}
+        assert len(cachefile.readlines()) == 1
+
+        with pytest.raises(tbx.Error) as err:
+            tbx.collect_missing_docs(".", cache=True)
+        assert "cache is only valid with static=True" in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_detail(tmpdir, monkeypatch):
+    """
+    collect_missing_docs(detail=True) returns MissingDoc records, keeping
+    same-named definitions in different modules apart, and finds class line
+    numbers without asking inspect to read the source of each class
+    """
+    pytest.dbgfunc()
+
+    def no_source(obj):
+        raise AssertionError("getsourcelines({!r})".format(obj))
+
+    monkeypatch.setattr(tbx.inspect, 'getsourcelines', no_source)
+    for mod in ("dta", "dtb"):
+        tmpdir.join(mod + ".py").write("\n".join([
+            "import os",
+            "",
+            "class Dup(object):",
+            "    def meth(self):",
+            "        pass",
+            "",
+            "def func():",
+            "    pass",
+            ""]))
+    exp = []
+    for mod in ("dta", "dtb"):
+        exp.extend([tbx.MissingDoc(mod, "Dup", 3, "class"),
+                    tbx.MissingDoc(mod, "Dup.meth", 4, "method"),
+                    tbx.MissingDoc(mod, "func", 7, "function")])
+    with tbx.chdir(tmpdir.strpath):
+        sys.path.insert(0, tmpdir.strpath)
+        try:
+            for static in (True, False):
+                result = tbx.collect_missing_docs(".", static=static,
+                                                  detail=True)
+                assert sorted(result) == exp
+            assert exp[2].name == "dta.func"
+            assert sorted(tbx.collect_missing_docs(".", static=True)) == \
+                ["Dup", "Dup.meth", "dta.func", "dtb.func"]
+
+            tbx.collect_missing_docs(".", static=True, cache=True)
+            result = tbx.collect_missing_docs(".", static=True, cache=True,
+                                              detail=True)
+            assert sorted(result) == exp
+            assert all(isinstance(_, tbx.MissingDoc) for _ in result)
+        finally:
+            sys.path.remove(tmpdir.strpath)
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_nested(tmpdir):
+    """
+    collect_missing_docs() names modules by their path below the tree root,
+    at any depth, and skips what *exclude* matches
+    """
+    pytest.dbgfunc()
+    for path in ["p/q/r.py", "p/q/__init__.py", "venv3/v.py",
+                 "p/.hid/h.py", "p/__pycache__/c.py", "x.egg-info/e.py",
+                 "p/setup.py", "top.py"]:
+        tmpdir.join(path).ensure().write("def func():\n    pass\n")
+    with tbx.chdir(tmpdir.strpath):
+        assert sorted(tbx.collect_missing_docs(".", static=True)) == [
+            "p.q.func", "p.q.r.func", "top.func"]
+        assert sorted(tbx.collect_missing_docs(
+            tmpdir.strpath, static=True,
+            exclude=["q/", ".*/", "*egg-info/"])) == [
+                "p.__pycache__.c.func", "p.setup.func", "top.func",
+                "venv3.v.func"]
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_static(tmpdir):
+    """
+    collect_missing_docs(static=True) finds what importing does, without
+    running any of the code, and a pool of workers finds the same
+    """
+    pytest.dbgfunc()
+    tmpdir.join("stpkg", "__init__.py").ensure().write("\n".join([
+        "def nodoc():",
+        "    pass",
+        "",
+        "class Klass(object):",
+        "    def method(self):",
+        "        pass",
+        "",
+        "    async def amethod(self):",
+        "        'documented'",
+        "",
+        "class Documented(object):",
+        "    'documented'",
+        "    def zmethod(self):",
+        "        pass",
+        "",
+        "class Ignored(object):",
+        "    pass",
+        "",
+        "def empty():",
+        "    ''",
+        ""]))
+    tmpdir.join("stpkg", "mod.py").write("\n".join([
+        "def b_func():",
+        "    pass",
+        "",
+        "def a_func():",
+        "    def inner():",
+        "        pass",
+        ""]))
+    exp = ["Documented.zmethod", "Klass", "Klass.method", "stpkg.nodoc",
+           "stpkg.mod.a_func", "stpkg.mod.b_func"]
+    with tbx.chdir(tmpdir.strpath):
+        sys.path.insert(0, tmpdir.strpath)
+        try:
+            assert tbx.collect_missing_docs(".", ignore_l=["Ignored"],
+                                            static=True) == exp
+            assert tbx.collect_missing_docs(".", ignore_l=["Ignored"]) == exp
+            assert tbx.collect_missing_docs(".", ignore_l=["Ignored"],
+                                            static=True, workers=2) == exp
+            assert tbx.collect_missing_docs(".", ignore_l=["Ignored"],
+                                            workers=2) == exp
+        finally:
+            sys.path.remove(tmpdir.strpath)
+            for name in [_ for _ in sys.modules if _.startswith("stpkg")]:
+                del sys.modules[name]
+            importlib.invalidate_caches()
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_static_blocks(tmpdir):
+    """
+    collect_missing_docs(static=True) agrees with importing about methods
+    that are classmethods or properties and about definitions made inside
+    if, try, and with statements
+    """
+    pytest.dbgfunc()
+    tmpdir.join("blkmod.py").write("\n".join([
+        "import contextlib",
+        "",
+        "class Klass(object):",
+        "    'documented'",
+        "    @classmethod",
+        "    def cm(cls):",
+        "        pass",
+        "",
+        "    @property",
+        "    def prop(self):",
+        "        pass",
+        "",
+        "    @prop.setter",
+        "    def prop(self, value):",
+        "        pass",
+        "",
+        "    @staticmethod",
+        "    def sm():",
+        "        pass",
+        "",
+        "    if True:",
+        "        def cond(self):",
+        "            pass",
+        "",
+        "if True:",
+        "    def guarded():",
+        "        pass",
+        "",
+        "try:",
+        "    from no_such_module import fallback",
+        "except ImportError:",
+        "    def fallback():",
+        "        pass",
+        "",
+        "with contextlib.suppress(Exception):",
+        "    def within():",
+        "        pass",
+        "",
+        "    class Inner(object):",
+        "        pass",
+        ""]))
+    exp = ["Inner", "Klass.cond", "Klass.sm", "blkmod.fallback",
+           "blkmod.guarded", "blkmod.within"]
+    with tbx.chdir(tmpdir.strpath):
+        sys.path.insert(0, tmpdir.strpath)
+        try:
+            assert tbx.collect_missing_docs(".", static=True) == exp
+            assert tbx.collect_missing_docs(".") == exp
+        finally:
+            sys.path.remove(tmpdir.strpath)
+            sys.modules.pop("blkmod", None)
+            importlib.invalidate_caches()
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_static_unsafe(tmpdir, capsys):
+    """
+    collect_missing_docs(static=True) doesn't run module code and survives
+    files that don't parse
+    """
+    pytest.dbgfunc()
+    marker = tmpdir.join("ran")
+    tmpdir.join("boom.py").write("\n".join([
+        "open({!r}, 'w').close()".format(marker.strpath),
+        "raise SystemExit(1)",
+        "def quiet():",
+        "    pass",
+        ""]))
+    tmpdir.join("broken.py").write("def broken(:\n")
+    with tbx.chdir(tmpdir.strpath):
+        result = tbx.collect_missing_docs(".", static=True)
+    assert result == ["boom.quiet"]
+    assert not marker.exists()
+    assert "boom" not in sys.modules
+    assert "SyntaxError: failed parsing ./broken.py" in capsys.readouterr().out
+
+
+# -----------------------------------------------------------------------------
+def test_missing_doc_td(tmpdir):
+    """
+    Write some .py files in tmpdir and test on those
+    """
+    pytest.dbgfunc()
+    tcontent = [
+        "def %_with_doc():",
+        "    \"\"\"",
+        "    This function has a docstring",
+        "    \"\"\"",
+        "    pass",
+        "",
+        "def %_no_doc():",
+        "    print(\"undocumented function\")", ]
+    fpath_l = {"testee/__init__.py": "ti",
+               "frippety/aardvark.py": "aard",
+               "frippety/__init__.py": "aard_init",
+               "venv/bogus.py": "bog",
+               ".foobar/fumple.py": "fump",
                "__pycache__/balderdash.py": "bald",
                "foo.egg-info/fooyung.py": "flop",
                "setup.py": "schtup",
@@ -697,6 +1927,61 @@ def test_my_name():
     assert tbx.my_name() == "test_my_name"
 
 
+# -----------------------------------------------------------------------------
+def test_pipeline(rdata):
+    """
+    tbx.pipeline([cmd1, cmd2, cmd3]) should connect the commands and report an
+    exit status for each stage
+    """
+    pytest.dbgfunc()
+    (out, status) = tbx.pipeline(["python -c 'import this'",
+                                  "grep better",
+                                  "wc -l"])
+    assert int(out) == len([_ for _ in rdata.exp if 'better' in _])
+    assert status == [0, 0, 0]
+
+
+# -----------------------------------------------------------------------------
+def test_pipeline_status():
+    """
+    A failing stage should show up in the status list without disturbing the
+    output of the pipeline
+    """
+    pytest.dbgfunc()
+    (out, status) = tbx.pipeline(["echo hello", "sh -c 'cat; exit 3'"],
+                                 output="| tr a-z A-Z")
+    assert out == "HELLO\n"
+    assert status == [0, 3, 0]
+
+
+# -----------------------------------------------------------------------------
+def test_pipeline_concurrent():
+    """
+    The stages run concurrently, so a reader that exits early stops an
+    endless writer (which would never finish if it ran to completion first)
+    """
+    pytest.dbgfunc()
+    (out, status) = tbx.pipeline(["yes", "head -n 3"])
+    assert out == "y\ny\ny\n"
+    assert status[1] == 0
+    assert status[0] != 0
+
+
+# -----------------------------------------------------------------------------
+def test_pipeline_input(tmpdir):
+    """
+    tbx.pipeline(cmds, input=str, output='> path')
+    """
+    pytest.dbgfunc()
+    outfile = tmpdir.join('outfile')
+    (out, status) = tbx.pipeline(["sort", "uniq -c"],
+                                 input="b\na\nb\n",
+                                 output="> {}".format(outfile.strpath))
+    assert out is None
+    assert status == [0, 0]
+    assert outfile.read().split() == ["1", "a", "2", "b"]
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("ref, direction, window, lowest, highest", [
     pytest.param(100, 1, 10, 100, 110, id="u"),
@@ -753,6 +2038,40 @@ def test_run_cmd(rdata):
         check_in(item, result)
 
 
+# -----------------------------------------------------------------------------
+def test_run_argv():
+    """
+    tbx.run([arg, ...]) uses the list as the argument vector without any
+    further parsing
+    """
+    pytest.dbgfunc()
+    assert tbx.run(["echo", "a  b", "'c'", "$HOME"]) == "a  b 'c' $HOME\n"
+    assert tbx.run(("printf", "%s|", "x y")) == "x y|"
+    (out, status) = tbx.pipeline([["printf", "b\\na\\n"], ["sort"]])
+    assert out == "a\nb\n"
+
+
+# -----------------------------------------------------------------------------
+def test_run_path_lookup(tmpdir):
+    """
+    Executables are looked up on the current $PATH, so changing $PATH finds
+    a different program even though lookups are cached
+    """
+    pytest.dbgfunc()
+    for name in ["one", "two"]:
+        script = tmpdir.join(name, "tbx_probe")
+        script.ensure()
+        script.write("#!/bin/sh\necho {}\n".format(name))
+        script.chmod(0o755)
+    path = os.getenv("PATH")
+    for name in ["one", "two", "one"]:
+        with tbx.envset(PATH=tmpdir.join(name).strpath + ":" + path):
+            assert tbx.run("tbx_probe") == name + "\n"
+            assert tbx.run(["tbx_probe"]) == name + "\n"
+    with pytest.raises(FileNotFoundError):
+        tbx.run("tbx_probe")
+
+
 # -----------------------------------------------------------------------------
 def test_run_cmd_istr(rdata):
     """
@@ -804,6 +2123,17 @@ def test_run_cmd_icmd(rdata):
         check_in(item, result)
 
 
+# -----------------------------------------------------------------------------
+def test_run_cmd_icmd_endless():
+    """
+    tbx.run(cmd, input='cmd |') connects the commands with a pipe, so an
+    endless input command is fine as long as the reader stops
+    """
+    pytest.dbgfunc()
+    result = tbx.run("head -n 2", input="yes |")
+    assert result == "y\ny\n"
+
+
 # -----------------------------------------------------------------------------
 def test_run_cmd_ifd(rdata, tmpdir):
     """
@@ -911,6 +2241,27 @@ def test_run_cmd_ocmd(rdata):
         check_in(item, result, negate=True)
 
 
+# -----------------------------------------------------------------------------
+def test_run_cmd_ocmd_endless():
+    """
+    tbx.run(cmd1, output='| cmd2') with an endless cmd1
+    """
+    pytest.dbgfunc()
+    result = tbx.run("yes", output="| head -n 2")
+    assert result == "y\ny\n"
+
+
+# -----------------------------------------------------------------------------
+def test_run_iter_icmd():
+    """
+    tbx.run_iter(cmd, input='cmd |') streams the output of a pipeline
+    """
+    pytest.dbgfunc()
+    gen = tbx.run_iter("cat", input="yes |")
+    assert [next(gen) for _ in range(3)] == ["y\n"] * 3
+    gen.close()
+
+
 # -----------------------------------------------------------------------------
 def test_run_cmd_ofd(rdata, tmpdir):
     """
@@ -944,6 +2295,363 @@ def test_run_cmd_ofobj(rdata, tmpdir):
         assert item in result
 
 
+# -----------------------------------------------------------------------------
+def test_run_result():
+    """
+    tbx.run(cmd, result=True) should return a RunResult with stdout and stderr
+    kept apart, the exit code, the pid, and timing information
+    """
+    pytest.dbgfunc()
+    result = tbx.run("sh -c 'echo out; echo err >&2; exit 3'", result=True)
+    assert isinstance(result, tbx.RunResult)
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert result.returncode == 3
+    assert 0 < result.pid
+    assert 0 <= result.spawn <= result.wall
+    assert 0 <= result.cpu
+    with pytest.raises(AttributeError):
+        result.extra = 1
+
+
+# -----------------------------------------------------------------------------
+def test_run_result_cpu():
+    """
+    The CPU time reported in a RunResult comes from the child's rusage
+    """
+    pytest.dbgfunc()
+    cmd = ("python -c 'import time\nend = time.process_time() + 0.3\n"
+           "while time.process_time() < end: pass'")
+    result = tbx.run(cmd, result=True)
+    assert result.returncode == 0
+    assert 0.2 < result.utime + result.stime
+    assert result.cpu <= result.wall
+
+
+# -----------------------------------------------------------------------------
+def test_run_result_bulk():
+    """
+    Large amounts of stdin, stdout, and stderr at the same time should not
+    deadlock
+    """
+    pytest.dbgfunc()
+    cmd = ("python -c 'import sys\ndata = sys.stdin.read()\n"
+           "sys.stderr.write(data)\nsys.stdout.write(data.upper())'")
+    data = "abcdefghijklmno\n" * 65536
+    result = tbx.run(cmd, input=data, result=True)
+    assert result.returncode == 0
+    assert result.stderr == data
+    assert result.stdout == data.upper()
+
+
+# -----------------------------------------------------------------------------
+def test_run_result_pipeline():
+    """
+    For a pipeline, the RunResult reports the last stage's exit code and
+    collects every stage's stderr
+    """
+    pytest.dbgfunc()
+    result = tbx.run("sh -c 'cat; echo two >&2'",
+                     input="sh -c 'echo data; echo one >&2' |",
+                     output="| sh -c 'cat; exit 5'",
+                     result=True)
+    assert result.stdout == "data\n"
+    assert sorted(result.stderr.split()) == ["one", "two"]
+    assert result.returncode == 5
+
+
+# -----------------------------------------------------------------------------
+def test_run_timeout(tmpdir):
+    """
+    tbx.run(cmd, timeout=N) should kill a child that runs too long and raise
+    TimeoutExpired
+    """
+    pytest.dbgfunc()
+    pidfile = tmpdir.join('pid')
+    cmd = "sh -c 'echo $$ > {}; exec sleep 10'".format(pidfile.strpath)
+    start = time.monotonic()
+    with pytest.raises(subp.TimeoutExpired) as err:
+        tbx.run(cmd, timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert err.value.cmd == cmd
+    assert err.value.timeout == 0.5
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pidfile.read()), 0)
+
+
+# -----------------------------------------------------------------------------
+def test_run_timeout_redirected(tmpdir):
+    """
+    The timeout also applies when no output is being collected
+    """
+    pytest.dbgfunc()
+    outfile = tmpdir.join('outfile')
+    with pytest.raises(subp.TimeoutExpired):
+        tbx.run("sleep 10", output="> {}".format(outfile.strpath),
+                timeout=0.3)
+    assert tbx.run("echo quick", timeout=5) == "quick\n"
+
+
+# -----------------------------------------------------------------------------
+def test_run_max_output_truncate():
+    """
+    With max_output_bytes, the output is truncated but the child runs to
+    completion
+    """
+    pytest.dbgfunc()
+    cmd = "python -c 'print(\"x\" * 1000000)'"
+    result = tbx.run(cmd, max_output_bytes=100, result=True)
+    assert result.stdout == "x" * 100
+    assert result.returncode == 0
+
+
+# -----------------------------------------------------------------------------
+def test_run_max_output_utf8():
+    """
+    Truncation does not split a multibyte character
+    """
+    pytest.dbgfunc()
+    result = tbx.run("cat", input="\u00e9" * 10, max_output_bytes=5)
+    assert result == "\u00e9" * 2
+
+    cmd = [sys.executable, "-c", "import sys, time;"
+           " out = sys.stdout.buffer;"
+           " out.write(b'ab\\xc3'); out.flush(); time.sleep(0.2);"
+           " out.write(b'\\xa9cd')"]
+    assert tbx.run(cmd, max_output_bytes=3) == "ab"
+    assert tbx.run(cmd, max_output_bytes=4) == "ab\u00e9"
+
+
+# -----------------------------------------------------------------------------
+def test_run_max_output_raise():
+    """
+    With overflow='raise', exceeding max_output_bytes kills the child and
+    raises tbx.Error
+    """
+    pytest.dbgfunc()
+    start = time.monotonic()
+    with pytest.raises(tbx.Error) as err:
+        tbx.run("yes", max_output_bytes=1000, overflow='raise')
+    assert "Output exceeded 1000 bytes" in str(err.value)
+    assert time.monotonic() - start < 5
+    with pytest.raises(tbx.Error) as err:
+        tbx.run("true", overflow='ignore')
+    assert "overflow must be" in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_run_rlimits():
+    """
+    rlimits are applied in the child; unknown names raise tbx.Error
+    """
+    pytest.dbgfunc()
+    result = tbx.run("sh -c 'ulimit -t'", rlimits={'cpu': 7})
+    assert result.strip() == "7"
+    result = tbx.run("sh -c 'ulimit -n'", rlimits={'nofile': (50, 60)})
+    assert result.strip() == "50"
+    cmd = "python -c 'x = bytearray(512 * 1024 * 1024)'"
+    result = tbx.run(cmd, rlimits={'as': 256 * 1024 * 1024}, result=True)
+    assert result.returncode != 0
+    assert "MemoryError" in result.stderr
+    with pytest.raises(tbx.Error) as err:
+        tbx.run("true", rlimits={'bogus': 1})
+    assert "Unknown rlimit 'bogus'" in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_run_iter_lines(rdata):
+    """
+    tbx.run_iter(cmd) should yield the command's output one line at a time,
+    adding up to what tbx.run(cmd) returns
+    """
+    pytest.dbgfunc()
+    cmd = "python -c 'import this'"
+    lines = list(tbx.run_iter(cmd))
+    assert 1 < len(lines)
+    assert all(_.endswith("\n") for _ in lines)
+    assert "".join(lines) == tbx.run(cmd)
+    for item in rdata.exp:
+        assert item + "\n" in lines
+
+
+# -----------------------------------------------------------------------------
+def test_run_iter_input(rdata):
+    """
+    tbx.run_iter(cmd, input=str) should feed the string to the child while
+    its output is being read
+    """
+    pytest.dbgfunc()
+    result = "".join(tbx.run_iter('python', input='import this\n'))
+    for item in rdata.exp:
+        assert item in result
+
+
+# -----------------------------------------------------------------------------
+def test_run_iter_chunk():
+    """
+    Lines longer than *chunk* bytes are yielded in pieces
+    """
+    pytest.dbgfunc()
+    pieces = list(tbx.run_iter("python -c 'print(\"x\" * 100)'", chunk=16))
+    assert "".join(pieces) == "x" * 100 + "\n"
+    assert max(len(_) for _ in pieces) <= 16
+
+
+# -----------------------------------------------------------------------------
+def test_run_iter_early_stop():
+    """
+    If the consumer stops reading early, the child should be killed and reaped
+    """
+    pytest.dbgfunc()
+    cmd = ("python -c 'import os\nprint(os.getpid(), flush=True)\n"
+           "while True: print(\"more\", flush=True)'")
+    gen = tbx.run_iter(cmd)
+    pid = int(next(gen))
+    assert next(gen) == "more\n"
+    gen.close()
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+# -----------------------------------------------------------------------------
+def test_run_many_ordered():
+    """
+    tbx.run_many() returns results in command order by default, even when a
+    later command finishes first
+    """
+    pytest.dbgfunc()
+    cmds = ["sh -c 'sleep 0.3; echo first'",
+            "echo second",
+            {'cmd': "tr a-z A-Z", 'input': "third\n"},
+            "sh -c 'exit 4'"]
+    result = list(tbx.run_many(cmds))
+    assert [_.cmd for _ in result] == [cmds[0], cmds[1], "tr a-z A-Z",
+                                       cmds[3]]
+    assert [_.stdout for _ in result] == ["first\n", "second\n",
+                                          "THIRD\n", ""]
+    assert [_.returncode for _ in result] == [0, 0, 0, 4]
+    assert result[0].wall >= 0.3
+
+
+# -----------------------------------------------------------------------------
+def test_run_many_unordered():
+    """
+    tbx.run_many(ordered=False) returns results as the commands complete
+    """
+    pytest.dbgfunc()
+    cmds = ["sh -c 'sleep 0.5; echo slow'", "echo fast"]
+    result = list(tbx.run_many(cmds, max_workers=2, ordered=False))
+    assert [_.stdout for _ in result] == ["fast\n", "slow\n"]
+
+
+# -----------------------------------------------------------------------------
+def test_run_many_concurrent():
+    """
+    With max_workers=4, four sleeps should overlap
+    """
+    pytest.dbgfunc()
+    start = time.monotonic()
+    result = list(tbx.run_many(["sleep 0.4"] * 4, max_workers=4))
+    assert time.monotonic() - start < 1.2
+    assert all(_.returncode == 0 for _ in result)
+
+
+# -----------------------------------------------------------------------------
+def test_run_many_eager(tmpdir):
+    """
+    tbx.run_many() starts the commands before the results are asked for
+    """
+    pytest.dbgfunc()
+    marker = tmpdir.join("ran")
+    result = tbx.run_many(["touch {}".format(marker.strpath)])
+    for _ in range(50):
+        if marker.exists():
+            break
+        time.sleep(0.1)
+    assert marker.exists()
+    assert next(result).returncode == 0
+
+
+# -----------------------------------------------------------------------------
+def test_shell_run():
+    """
+    tbx.Shell().run() runs commands in one long-lived shell, returning stdout
+    + stderr the way tbx.run() does
+    """
+    pytest.dbgfunc()
+    with tbx.Shell() as shell:
+        assert shell.run("echo hello; echo oops >&2") == "hello\noops\n"
+        assert shell.run("printf abc") == "abc"
+        assert shell.run(["echo", "a  b", "$HOME"]) == "a  b $HOME\n"
+        assert shell.run("echo $$") == "{}\n".format(shell.pid)
+        assert shell.run("echo $$") == "{}\n".format(shell.pid)
+
+
+# -----------------------------------------------------------------------------
+def test_shell_result():
+    """
+    Shell.run(result=True) keeps stdout and stderr apart and reports the exit
+    code. Neither 'exit' nor a syntax error takes down the shell.
+    """
+    pytest.dbgfunc()
+    with tbx.Shell() as shell:
+        result = shell.run("echo out; echo err >&2; exit 3", result=True)
+        assert isinstance(result, tbx.RunResult)
+        assert result.stdout == "out\n"
+        assert result.stderr == "err\n"
+        assert result.returncode == 3
+        assert result.cpu is None
+        result = shell.run("if", result=True)
+        assert result.returncode != 0
+        assert "Syntax error" in result.stderr
+        assert shell.run("echo still here") == "still here\n"
+
+
+# -----------------------------------------------------------------------------
+def test_shell_redirect(tmpdir):
+    """
+    Shell.run() accepts the same input and output forms as tbx.run()
+    """
+    pytest.dbgfunc()
+    outfile = tmpdir.join('outfile')
+    outstr = io.StringIO()
+    with tbx.Shell() as shell:
+        assert shell.run("tr a-z A-Z", input="data\n") == "DATA\n"
+        assert shell.run("cat", input=io.StringIO("sio")) == "sio"
+        assert shell.run("head -n 2", input="yes |",
+                         output="| tr y Y") == "Y\nY\n"
+        assert shell.run("echo file",
+                         output="> {}".format(outfile.strpath)) is None
+        assert outfile.read() == "file\n"
+        assert shell.run("cat",
+                         input="< {}".format(outfile.strpath)) == "file\n"
+        assert shell.run("cat", input=outfile.open()) == "file\n"
+        with outfile.open('rb') as rbl:
+            assert shell.run("cat", input=rbl) == tbx.run("cat", input=rbl)
+        assert shell.run("cat", input=["a", "b"]) == ""
+        assert shell.run("echo sio", output=outstr) is None
+        assert outstr.getvalue() == "sio\n"
+        with pytest.raises(tbx.Error) as err:
+            shell.run("echo", output="foobar")
+        assert '| or > required for string output' in str(err.value)
+
+
+# -----------------------------------------------------------------------------
+def test_shell_closed():
+    """
+    After the shell is closed, Shell.run() raises tbx.Error
+    """
+    pytest.dbgfunc()
+    shell = tbx.Shell()
+    pid = shell.pid
+    shell.close()
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+    with pytest.raises(tbx.Error) as err:
+        shell.run("true")
+    assert "is not running" in str(err.value)
+
+
 # -----------------------------------------------------------------------------
 def test_version():
     """
@@ -954,6 +2662,79 @@ def test_version():
     assert tbx.version() == tbx.verinfo._v
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("exclude, include, exp", [
+    pytest.param(None, None, [".top.py", "a/.h/c/i.py", "a/b/.d/j.py",
+                              "a/b/.k.py", "a/b/c/h.py", "a/b/g.py",
+                              "a/f.py", "t.py", "x/y/z.txt"], id="all"),
+    pytest.param(".*", None, ["a/b/c/h.py", "a/b/g.py", "a/f.py", "t.py",
+                              "x/y/z.txt"], id="dot"),
+    pytest.param(".*/", None, [".top.py", "a/b/.k.py", "a/b/c/h.py",
+                               "a/b/g.py", "a/f.py", "t.py", "x/y/z.txt"],
+                 id="dotdir"),
+    pytest.param("c/", "*.py", [".top.py", "a/b/.d/j.py", "a/b/.k.py",
+                                "a/b/g.py", "a/f.py", "t.py"], id="include"),
+    pytest.param("/a/b", None, [".top.py", "a/.h/c/i.py", "a/f.py", "t.py",
+                                "x/y/z.txt"], id="anchored"),
+    pytest.param("b/g.py", None, [".top.py", "a/.h/c/i.py", "a/b/.d/j.py",
+                                  "a/b/.k.py", "a/b/c/h.py", "a/b/g.py",
+                                  "a/f.py", "t.py", "x/y/z.txt"],
+                 id="anchored_miss"),
+    pytest.param("**/b/g.py", None, [".top.py", "a/.h/c/i.py",
+                                     "a/b/.d/j.py", "a/b/.k.py",
+                                     "a/b/c/h.py", "a/f.py", "t.py",
+                                     "x/y/z.txt"], id="starstar"),
+    pytest.param(None, "a/**", ["a/.h/c/i.py", "a/b/.d/j.py", "a/b/.k.py",
+                                "a/b/c/h.py", "a/b/g.py", "a/f.py"],
+                 id="below"),
+    pytest.param(["*.py", "!h.py"], None, ["a/b/c/h.py", "x/y/z.txt"],
+                 id="negate"),
+    pytest.param(None, "[!.]*.py", ["a/.h/c/i.py", "a/b/.d/j.py",
+                                    "a/b/c/h.py", "a/b/g.py", "a/f.py",
+                                    "t.py"], id="class"),
+    pytest.param("# not a pattern\n\n*.txt\n.*/\n!.d/\n", None,
+                 [".top.py", "a/b/.d/j.py", "a/b/.k.py", "a/b/c/h.py",
+                  "a/b/g.py", "a/f.py", "t.py"], id="gitignore"),
+])
+def test_walk(globtree, exclude, include, exp):
+    """
+    tbx.walk() generates the relative paths of the files in a tree, less
+    what gitignore-style *exclude* matches and limited to what *include*
+    matches
+    """
+    pytest.dbgfunc()
+    result = list(tbx.walk(globtree.strpath, exclude=exclude,
+                           include=include))
+    assert sorted(result) == exp
+
+
+# -----------------------------------------------------------------------------
+def test_walk_order(globtree, monkeypatch):
+    """
+    tbx.walk() gives the paths in the order os.walk() does, and doesn't
+    list excluded directories
+    """
+    pytest.dbgfunc()
+    root = globtree.strpath
+    exp = [os.path.relpath(os.path.join(dp, _), root)
+           for (dp, _, fl) in os.walk(root) for _ in fl]
+    assert list(tbx.walk(root)) == exp
+    with tbx.chdir(root):
+        assert list(tbx.walk(".")) == exp
+
+    listed = []
+    real_list = tbx._glob_list
+
+    def counting_list(dirpath):
+        listed.append(os.path.relpath(dirpath, root))
+        return real_list(dirpath)
+
+    monkeypatch.setattr(tbx, '_glob_list', counting_list)
+    assert list(tbx.walk(root, exclude="b/\nx/")) == [
+        _ for _ in exp if _.startswith(("a/.h", "a/f", ".top", "t."))]
+    assert sorted(listed) == [".", "a", "a/.h", "a/.h/c"]
+
+
 # -----------------------------------------------------------------------------
 def test_deployable():
     """
@@ -995,6 +2776,17 @@ def check_in(a, b, negate=False):
             assert bytes(a, 'utf8') in b
 
 
+# -----------------------------------------------------------------------------
+def settle(tree):
+    """
+    Set the times of the directories in *tree* an hour back so GlobCache will
+    keep their listings
+    """
+    then = time.time() - 3600
+    for (dirpath, _, _) in os.walk(tree.strpath):
+        os.utime(dirpath, (then, then))
+
+
 # -----------------------------------------------------------------------------
 @pytest.fixture
 def ctest(tmpdir):
@@ -1047,6 +2839,20 @@ def get_this():
             ]
 
 
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def globtree(tmpdir):
+    """
+    Set up a small tree with hidden files and directories for glob tests
+    """
+    for path in ['a/b/c', 'a/.h/c', 'x/y', 'a/b/.d']:
+        tmpdir.join(path).ensure(dir=True)
+    for path in ['a/f.py', 'a/b/g.py', 'a/b/c/h.py', 'a/.h/c/i.py',
+                 '.top.py', 't.py', 'x/y/z.txt', 'a/b/.d/j.py', 'a/b/.k.py']:
+        tmpdir.join(path).ensure()
+    return tmpdir
+
+
 # -----------------------------------------------------------------------------
 @pytest.fixture
 def rdata():